@@ -0,0 +1,111 @@
+"""Adaptive concurrency limit for checkout creation
+
+/pay spends its time waiting on Stripe. When Stripe slows down, each
+request holds its thread longer, new ones queue behind them, and soon every
+request in the queue times out: throughput collapses to almost nothing.
+AdaptiveLimiter caps how many checkout creations run at once in a worker and
+rejects the rest straight away, so the ones admitted finish in time, and
+callers get a 503 with Retry-After that they can act on.
+
+The limit follows Stripe's latency, AIMD style:
+
+- every call that completes within tolerance times the baseline latency
+  while the limit is in use raises it by 1/limit, i.e. by about one per
+  round of calls
+- a slower call, or one that failed from overload (timeout, connection
+  error, deadline), cuts it by backoff, at most once per round trip so one
+  burst of slow responses is not counted many times over
+
+The baseline is the fastest call seen in the previous BASELINE_WINDOW
+seconds. Latency that our own concurrency causes (Stripe queueing or rate
+limiting us) pushes calls above it and the limit comes down. If Stripe is
+slow for everyone, the baseline rises to match within a window and the
+limit recovers, since cutting concurrency then would only cost throughput.
+
+Only checkout creation goes through it, so webhooks and health checks keep
+being served when checkouts are shed. max_limit should leave some of a
+worker's threads free for them.
+"""
+import math
+import threading
+import time
+
+BASELINE_WINDOW = 30.0
+
+
+class Permit:
+    """One admitted call; release() it exactly once with how it went"""
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+        self._released = False
+
+    def release(self, latency=None, overloaded=False):
+        if not self._released:
+            self._released = True
+            self._limiter._release(latency, overloaded)
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit=6, min_limit=1, initial_limit=None, backoff=0.75, tolerance=2.0):
+        self.limit = float(initial_limit or max_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.baseline = None
+        self._window_min = math.inf
+        self._window_start = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "rejected": 0, "decreases": 0}
+
+    def try_acquire(self):
+        """Returns a Permit, or None if the limit is reached"""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self._stats["rejected"] += 1
+                return None
+            self.in_flight += 1
+            self._stats["admitted"] += 1
+        return Permit(self)
+
+    def retry_after(self):
+        """Whole seconds a rejected caller should wait: about one round trip"""
+        return max(1, math.ceil(self.baseline or 1))
+
+    def _release(self, latency, overloaded):
+        now = time.monotonic()
+        with self._lock:
+            busy = self.in_flight >= self.limit / 2
+            self.in_flight -= 1
+            if latency is None:
+                return
+
+            slow = self.baseline is not None and latency > self.tolerance * self.baseline
+            if overloaded or slow:
+                if now - self._last_decrease > (self.baseline or latency):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self._stats["decreases"] += 1
+            elif busy:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            if not overloaded:
+                self._window_min = min(self._window_min, latency)
+                if self.baseline is None:
+                    self.baseline = latency
+                if now - self._window_start > BASELINE_WINDOW:
+                    self.baseline = self._window_min
+                    self._window_min = math.inf
+                    self._window_start = now
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                limit=round(self.limit, 2),
+                in_flight=self.in_flight,
+                baseline=round(self.baseline, 4) if self.baseline is not None else None,
+            )
@@ -0,0 +1,166 @@
+"""Rolling checkout and revenue totals, updated as orders are created and paid
+
+Counts are kept in ring buffers of fixed-width time buckets at three
+resolutions: the last 60 minutes, 24 hours and 30 days. Each bucket holds
+
+    start, sessions created, payments, gross amount per currency (minor units)
+
+as int64s. Recording an event adds to the current bucket at every
+resolution, first clearing it if it still holds an older period, so writes
+and reads cost the same however many events have been seen, and nothing has
+to be paged from Stripe to answer "how much did we take in the last hour".
+
+The buffers live in one small file mapped into every gunicorn worker, so
+/pay in one worker and the webhook in another add to the same totals.
+Updates take an flock on the file besides a thread lock; reads do not lock
+and may see an update half applied. Gross amounts are kept for the first
+MAX_CURRENCIES currencies seen; later ones are counted as payments only.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-process dev server only
+    fcntl = None
+
+MAGIC = b"AGG1"
+MAX_CURRENCIES = 8
+# name, bucket width in seconds, buckets
+RESOLUTIONS = (("minute", 60, 60), ("hour", 3600, 24), ("day", 86400, 30))
+
+HEADER = struct.Struct("<4s4x" + "8s" * MAX_CURRENCIES)
+BUCKET_FIELDS = 3 + MAX_CURRENCIES
+START, SESSIONS, PAYMENTS, GROSS = 0, 1, 2, 3
+SIZE = HEADER.size + 8 * BUCKET_FIELDS * sum(n for _, _, n in RESOLUTIONS)
+
+DEFAULT_PATH = "aggregates.bin"
+
+
+class Aggregates:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = self._map = self._values = None
+
+    def _open(self):
+        # Open per process: forked workers must not share the flock'd file
+        if self._pid == os.getpid():
+            return
+        f = open(self.path, "a+b")
+        with _FileLock(f.fileno()):
+            f.seek(0)
+            if f.read(len(MAGIC)) != MAGIC or os.fstat(f.fileno()).st_size != SIZE:
+                f.truncate(0)
+                f.write(MAGIC + bytes(SIZE - len(MAGIC)))
+                f.flush()
+        self._file = f
+        self._map = mmap.mmap(f.fileno(), SIZE)
+        self._values = memoryview(self._map)[HEADER.size:].cast("q")
+        self._pid = os.getpid()
+
+    def _bucket(self, resolution, now):
+        """Offset of now's bucket in resolution, cleared if it holds an older period
+
+        None if the bucket has already moved on to a later period, i.e. now
+        is too old for this resolution's window.
+        """
+        base = 0
+        for name, width, count in RESOLUTIONS:
+            if name == resolution:
+                break
+            base += count * BUCKET_FIELDS
+        start = int(now) // width * width
+        offset = base + (start // width % count) * BUCKET_FIELDS
+        values = self._values
+        if values[offset + START] > start:
+            return None
+        if values[offset + START] != start:
+            values[offset:offset + BUCKET_FIELDS] = memoryview(bytes(8 * BUCKET_FIELDS)).cast("q")
+            values[offset + START] = start
+        return offset
+
+    def _currency_slot(self, currency):
+        codes = HEADER.unpack_from(self._map)[1:]
+        key = currency.lower().encode("ascii")
+        for i, code in enumerate(codes):
+            if code.rstrip(b"\0") == key:
+                return i
+            if not code.strip(b"\0"):
+                struct.pack_into("8s", self._map, 8 + 8 * i, key)
+                return i
+        return None
+
+    def _add(self, now, sessions=0, amount=None, currency=None):
+        with self._lock:
+            self._open()
+            with _FileLock(self._file.fileno()):
+                slot = self._currency_slot(currency) if currency else None
+                for name, _, _ in RESOLUTIONS:
+                    offset = self._bucket(name, now)
+                    if offset is None:
+                        continue
+                    self._values[offset + SESSIONS] += sessions
+                    if amount is not None:
+                        self._values[offset + PAYMENTS] += 1
+                        if slot is not None:
+                            self._values[offset + GROSS + slot] += amount
+
+    def record_session(self, now=None):
+        """Counts one checkout session created by /pay"""
+        self._add(now or time.time(), sessions=1)
+
+    def record_payment(self, amount, currency, now=None):
+        """Counts one paid order of amount (minor units) in currency"""
+        self._add(now or time.time(), amount=int(amount or 0), currency=currency)
+
+    def snapshot(self, now=None):
+        """Totals and non-empty buckets for each resolution's window"""
+        now = int(now or time.time())
+        with self._lock:
+            self._open()
+        codes = [code.rstrip(b"\0").decode("ascii") for code in HEADER.unpack_from(self._map)[1:]]
+        values = self._values
+        result = {}
+        base = 0
+        for name, width, count in RESOLUTIONS:
+            oldest = (now // width - count + 1) * width
+            totals = {"sessions": 0, "payments": 0, "gross": {}}
+            buckets = []
+            for i in range(count):
+                bucket = values[base + i * BUCKET_FIELDS:base + (i + 1) * BUCKET_FIELDS]
+                if bucket[START] < oldest or not (bucket[SESSIONS] or bucket[PAYMENTS]):
+                    continue
+                gross = {code: bucket[GROSS + j] for j, code in enumerate(codes) if code and bucket[GROSS + j]}
+                buckets.append({
+                    "start": bucket[START], "sessions": bucket[SESSIONS],
+                    "payments": bucket[PAYMENTS], "gross": gross,
+                })
+                totals["sessions"] += bucket[SESSIONS]
+                totals["payments"] += bucket[PAYMENTS]
+                for code, amount in gross.items():
+                    totals["gross"][code] = totals["gross"].get(code, 0) + amount
+            totals["conversion"] = (
+                round(totals["payments"] / totals["sessions"], 4) if totals["sessions"] else None
+            )
+            buckets.sort(key=lambda bucket: bucket["start"])
+            result[name] = dict(totals, window_seconds=width * count, buckets=buckets)
+            base += count * BUCKET_FIELDS
+        return result
+
+
+class _FileLock:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
@@ -0,0 +1,265 @@
+"""Columnar payment analytics over the order ledger or the event archive
+
+Rows are extracted once into one flat file per column in the analytics
+directory:
+
+    amount    int64, minor units
+    created   int64, unix seconds
+    currency  uint8, index into the build's currency list
+    status    uint8, index into its status list (order status for the
+              ledger, event type for the archive)
+
+and queried through numpy memory maps, so a query over tens of millions of
+rows touches only the pages it reads and runs as a handful of vectorized
+passes instead of a Python loop per row. Amounts are always grouped by
+currency and status: summing across either would mix currencies, or count
+a payment once per event Stripe sent for it.
+
+A build writes a new set of files and then swaps <source>.json, the file
+that names them, so queries in other workers keep reading the previous set
+until it is replaced. Builds are full; load() rebuilds once the columns are
+older than max_age, one worker at a time under an flock, and the others
+wait for it and use its result. Callers that must not build (the HTTP
+endpoint) pass rebuild=False and get the newest build however old it is.
+
+numpy is an optional dependency: everything else in the app runs without
+it, and the analytics command and endpoint report that it is missing.
+"""
+import json
+import os
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-process dev server only
+    fcntl = None
+
+COLUMNS = {"amount": "<i8", "created": "<i8", "currency": "u1", "status": "u1"}
+SOURCES = ("ledger", "archive")
+BUCKETS = {"hour": "h", "day": "D", "month": "M"}
+CHUNK_ROWS = 65536
+DEFAULT_MAX_AGE = 300
+
+# Where each archived event type keeps the amount it reports
+EVENT_AMOUNT_FIELDS = {
+    "checkout.session.completed": "amount_total",
+    "payment_intent.succeeded": "amount_received",
+    "charge.succeeded": "amount",
+    "charge.refunded": "amount_refunded",
+}
+
+
+class AnalyticsUnavailable(Exception):
+    pass
+
+
+def _require_numpy():
+    if np is None:
+        raise AnalyticsUnavailable("Analytics needs numpy: pip install numpy")
+
+
+def _ledger_rows(ledger):
+    for order in ledger.iter_orders(0, time.time() + 1):
+        yield order["amount"] or 0, order["created"], order["currency"] or "", order["status"]
+
+
+def _archive_rows(archive):
+    for _, event_type, created, payload in archive.iter_range(0, time.time() + 1):
+        field = EVENT_AMOUNT_FIELDS.get(event_type)
+        if field is None:
+            continue
+        obj = json.loads(payload)["data"]["object"]
+        yield obj.get(field) or 0, created, obj.get("currency") or "", event_type
+
+
+class Columns:
+    """One build's columns, memory-mapped read-only"""
+
+    def __init__(self, directory, meta):
+        self.meta = meta
+        self.rows = meta["rows"]
+        self.currencies = meta["currencies"]
+        self.statuses = meta["statuses"]
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(directory, meta["files"][name])
+            if self.rows:
+                column = np.memmap(path, dtype=dtype, mode="r", shape=(self.rows,))
+            else:
+                column = np.empty(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def summarize(self, start=None, end=None, bucket=None, percentiles=()):
+        """Count, total and mean amount per (bucket, currency, status)
+
+        bucket is one of BUCKETS, or None for a single period; percentiles
+        are of amount, 0-100, per group.
+        """
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise ValueError("Percentiles must be between 0 and 100")
+        mask = np.ones(self.rows, dtype=bool)
+        if start is not None:
+            mask &= self.created >= start
+        if end is not None:
+            mask &= self.created < end
+        amount = self.amount[mask]
+        created = self.created[mask]
+        currency = self.currency[mask].astype(np.int64)
+        status = self.status[mask].astype(np.int64)
+
+        n_currencies = max(1, len(self.currencies))
+        n_statuses = max(1, len(self.statuses))
+        key = status * n_currencies + currency
+        if bucket is not None:
+            periods = created.astype("datetime64[s]").astype("datetime64[%s]" % BUCKETS[bucket])
+            first = periods.min() if len(periods) else None
+            offsets = (periods - first).astype(np.int64) if first is not None else periods.astype(np.int64)
+            key = offsets * (n_statuses * n_currencies) + key
+
+        # Dense key space: one O(n) pass per aggregate instead of a sort
+        counts = np.bincount(key, minlength=0)
+        totals = np.bincount(key, weights=amount, minlength=len(counts))
+        present = np.nonzero(counts)[0]
+
+        quantiles = {}
+        if percentiles and len(key):
+            order = np.lexsort((amount, key))
+            sorted_amounts = amount[order].astype(np.float64)
+            starts = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+            for p in percentiles:
+                position = starts + (counts[present] - 1) * (p / 100.0)
+                low = np.floor(position).astype(np.int64)
+                high = np.ceil(position).astype(np.int64)
+                fraction = position - low
+                quantiles[p] = sorted_amounts[low] * (1 - fraction) + sorted_amounts[high] * fraction
+
+        groups = []
+        for i, k in enumerate(present.tolist()):
+            period, rest = divmod(k, n_statuses * n_currencies)
+            status_index, currency_index = divmod(rest, n_currencies)
+            group = {
+                "currency": self.currencies[currency_index] if self.currencies else None,
+                "status": self.statuses[status_index] if self.statuses else None,
+                "count": int(counts[k]),
+                "amount": int(totals[k]),
+                "mean": round(float(totals[k] / counts[k]), 2),
+            }
+            if bucket is not None:
+                group["period"] = str(first + np.timedelta64(period, BUCKETS[bucket]))
+            for p, values in quantiles.items():
+                group["p%g" % p] = round(float(values[i]), 2)
+            groups.append(group)
+        return groups
+
+
+def build(rows, directory, source):
+    """Writes rows of (amount, created, currency, status) as a new build of source
+
+    Rows are converted and written CHUNK_ROWS at a time, so memory stays flat
+    however many there are.
+    """
+    _require_numpy()
+    os.makedirs(directory, exist_ok=True)
+    build_id = "%d-%d" % (time.time() * 1000, os.getpid())
+    files = {name: "%s.%s.%s" % (source, name, build_id) for name in COLUMNS}
+    outputs = {name: open(os.path.join(directory, path), "wb") for name, path in files.items()}
+    currencies, statuses = {}, {}
+    count = 0
+
+    def write(chunk):
+        amounts, created, currency, status = zip(*chunk)
+        for name, values in (("amount", amounts), ("created", created), ("currency", currency), ("status", status)):
+            np.asarray(values, dtype=COLUMNS[name]).tofile(outputs[name])
+
+    try:
+        chunk = []
+        for amount, created, currency, status in rows:
+            currency_index = currencies.setdefault(currency.lower(), len(currencies))
+            status_index = statuses.setdefault(status, len(statuses))
+            if currency_index > 255 or status_index > 255:
+                raise ValueError("More than 256 distinct currencies or statuses")
+            chunk.append((amount, created, currency_index, status_index))
+            if len(chunk) == CHUNK_ROWS:
+                write(chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            write(chunk)
+            count += len(chunk)
+    finally:
+        for output in outputs.values():
+            output.close()
+
+    meta = {
+        "source": source,
+        "built_at": time.time(),
+        "rows": count,
+        "files": files,
+        "currencies": list(currencies),
+        "statuses": list(statuses),
+    }
+    tmp = os.path.join(directory, "%s.json.%s" % (source, build_id))
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, source + ".json"))
+
+    # Earlier builds; workers still reading them keep their mapping open.
+    # Callers hold the build lock, so no other build is in progress
+    for name in os.listdir(directory):
+        if name.startswith(source + ".") and build_id not in name and name not in (source + ".json", source + ".lock"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return Columns(directory, meta)
+
+
+def _read_meta(directory, source):
+    try:
+        with open(os.path.join(directory, source + ".json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _fresh(meta, max_age):
+    return meta is not None and time.time() - meta["built_at"] <= max_age
+
+
+def load(directory, source, ledger=None, archive=None, max_age=DEFAULT_MAX_AGE, refresh=False, rebuild=True):
+    """Columns of source, rebuilt first if missing, older than max_age, or refresh is set
+
+    With rebuild=False nothing is rebuilt: the newest build is returned as it
+    is, and AnalyticsUnavailable raised if there is none yet.
+    """
+    _require_numpy()
+    if source not in SOURCES:
+        raise ValueError("Unknown analytics source: %s" % source)
+    meta = _read_meta(directory, source)
+    if not rebuild:
+        if meta is None:
+            raise AnalyticsUnavailable("No %s columns built yet: run flask analytics --source %s" % (source, source))
+        try:
+            return Columns(directory, meta)
+        except FileNotFoundError:
+            # Replaced by a newer build since we read its name
+            return Columns(directory, _read_meta(directory, source))
+    if not refresh and _fresh(meta, max_age):
+        try:
+            return Columns(directory, meta)
+        except FileNotFoundError:
+            pass  # replaced by a newer build since we read its name
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, source + ".lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        meta = _read_meta(directory, source)
+        if not refresh and _fresh(meta, max_age):
+            return Columns(directory, meta)
+        rows = _ledger_rows(ledger) if source == "ledger" else _archive_rows(archive)
+        return build(rows, directory, source)
@@ -1,33 +1,184 @@
-import stripe
 import os
+import hmac
 import json
-from flask import Flask, render_template, request, jsonify
-from twilio.rest import Client
+import time
+from functools import partial
+import click
+from flask import (
+    Flask, Blueprint, Response, current_app, g, redirect, render_template, request, jsonify, stream_with_context,
+)
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
+import deadlines
+from config import Config
+from event_archive import EventArchive
+from admission import AdaptiveLimiter
+from aggregates import Aggregates
+from ledger import OrderLedger
+from order_status import OrderStatusBoard, public as public_order
+from reconcile import reconcile, DEFAULT_WINDOW_SECONDS
+from retry_policy import RetryPolicy, install_stripe as install_stripe_retries
+from stripe_cache import StripeObjectCache
 
-# Load environment variables
-load_dotenv()
+bp = Blueprint("payments", __name__, cli_group=None)
 
-# Initialize Flask app
-app = Flask(__name__)
+# What /pay sells; amounts are in the currency's minor unit
+CATALOG = {
+    "premium": {
+        "name": "Premium Package",
+        "description": "Access to all premium features",
+        "amount": 5000,  # $50.00
+        "currency": "usd",
+    },
+}
 
-# Stripe API Key
-stripe.api_key = os.getenv("STRIPE_API_KEY")
+def create_app(config=None):
+    """Application factory; config is a Config object or a mapping of overrides"""
+    # Load environment variables
+    load_dotenv()
 
-# Twilio Credentials
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
-CUSTOMER_PHONE_NUMBER = os.getenv("CUSTOMER_PHONE_NUMBER")
+    # Initialize Flask app
+    app = Flask(__name__)
+    app.config.from_object(Config())
+    if config is not None:
+        if isinstance(config, dict):
+            app.config.update(config)
+        else:
+            app.config.from_object(config)
+
+    # Local record of orders and SMS confirmations
+    app.extensions["ledger"] = OrderLedger(app.config["ORDER_DB_PATH"])
+
+    # Raw verified webhook events, for replay and audit
+    app.extensions["event_archive"] = EventArchive(
+        app.config["EVENT_ARCHIVE_DIR"],
+        segment_bytes=app.config["EVENT_ARCHIVE_SEGMENT_BYTES"],
+        retention_days=app.config["EVENT_ARCHIVE_RETENTION_DAYS"],
+    )
+
+    # Paid orders for the success page, pushed by the webhook
+    app.extensions["order_status"] = OrderStatusBoard(max_waiters=app.config["ORDER_EVENTS_MAX_WAITERS"])
+
+    # Rolling checkout and revenue totals shared by all workers
+    app.extensions["aggregates"] = Aggregates(app.config["AGGREGATES_PATH"])
+
+    # Retrieved Stripe objects, kept fresh by webhook events
+    app.extensions["stripe_cache"] = StripeObjectCache(
+        max_bytes=app.config["STRIPE_CACHE_MAX_BYTES"], ttl=app.config["STRIPE_CACHE_TTL"]
+    )
+
+    # Checkout sessions created ahead of time, so /pay can skip the Stripe call
+    if app.config["CHECKOUT_POOL_SIZE"] > 0:
+        from checkout_pool import CheckoutPool
+        app.extensions["checkout_pool"] = CheckoutPool(
+            app.extensions["ledger"],
+            partial(_create_pooled_session, app),
+            {item: (product["amount"], product["currency"]) for item, product in CATALOG.items()},
+            size=app.config["CHECKOUT_POOL_SIZE"],
+            lock_path=app.config["ORDER_DB_PATH"] + ".pool.lock",
+            min_remaining=app.config["CHECKOUT_POOL_MIN_REMAINING"],
+        )
+
+    # Sheds /pay when Stripe slows down instead of queueing it
+    app.extensions["checkout_limiter"] = AdaptiveLimiter(max_limit=app.config["CHECKOUT_MAX_CONCURRENCY"])
+
+    # One retry budget per dependency, shared by every request in this worker
+    app.extensions["retry_policies"] = {
+        name: RetryPolicy(
+            name,
+            max_retries=app.config[name.upper() + "_MAX_RETRIES"],
+            budget_ratio=app.config["RETRY_BUDGET"],
+            deadline=app.config["RETRY_DEADLINE"],
+        )
+        for name in ("stripe", "twilio")
+    }
+
+    if app.config["HTTP_CASSETTE"]:
+        from cassette import Cassette
+        app.extensions["cassette"] = Cassette(
+            app.config["HTTP_CASSETTE"],
+            app.config["HTTP_CASSETTE_MODE"],
+            latency_scale=app.config["HTTP_CASSETTE_LATENCY_SCALE"],
+        )
+        print(f"Using HTTP cassette {app.config['HTTP_CASSETTE']} ({app.config['HTTP_CASSETTE_MODE']})")
+
+    app.register_blueprint(bp)
+    return app
+
+def get_ledger():
+    return current_app.extensions["ledger"]
+
+def get_stripe_cache():
+    return current_app.extensions["stripe_cache"]
+
+def get_event_archive():
+    return current_app.extensions["event_archive"]
+
+def get_aggregates():
+    return current_app.extensions["aggregates"]
+
+def get_order_status():
+    return current_app.extensions["order_status"]
+
+# stripe and twilio.rest each import hundreds of modules, so they are loaded on
+# first use rather than at startup; see benchmarks/startup.py
+def get_stripe():
+    """Returns the stripe module configured with this app's API key"""
+    import stripe
+    stripe.api_key = current_app.config["STRIPE_API_KEY"]
+    install_stripe_retries(current_app.extensions["retry_policies"]["stripe"])
+    if current_app.config["STRIPE_SPEEDUPS"]:
+        import stripe_speedups
+        stripe_speedups.install()
+    if current_app.config["STRIPE_SINGLEFLIGHT"]:
+        import stripe_singleflight
+        stripe_singleflight.install()
+    if "cassette" in current_app.extensions:
+        stripe.default_http_client = current_app.extensions["cassette"].stripe_client()
+    import stripe_deadlines
+    stripe_deadlines.install(current_app.config["STRIPE_TIMEOUT"])
+    if current_app.config["STRIPE_HEDGING"]:
+        import stripe_hedging
+        stripe_hedging.install(
+            budget_ratio=current_app.config["STRIPE_HEDGE_BUDGET"],
+            percentile=current_app.config["STRIPE_HEDGE_PERCENTILE"],
+        )
+    return stripe
+
+def get_twilio_client():
+    """Creates a Twilio client from this app's credentials"""
+    from twilio.rest import Client
+    config = current_app.config
+    if "cassette" in current_app.extensions:
+        http_client = current_app.extensions["cassette"].twilio_client()
+    else:
+        from twilio.http.http_client import TwilioHttpClient
+        http_client = TwilioHttpClient()
+    http_client = deadlines.DeadlineTwilioClient(http_client, config["TWILIO_TIMEOUT"])
+    return Client(config["TWILIO_ACCOUNT_SID"], config["TWILIO_AUTH_TOKEN"], http_client=http_client)
+
+def _twilio_retryable(error):
+    """Errors after which the message was certainly not sent"""
+    from requests.exceptions import ConnectionError
+    from twilio.base.exceptions import TwilioRestException
+    if isinstance(error, TwilioRestException):
+        return error.status in (429, 503)
+    # Includes connect timeouts but not read timeouts, which may come after
+    # Twilio accepted the message
+    return isinstance(error, ConnectionError)
 
 def send_sms(body_text):
     """Helper function to send SMS with proper error handling"""
+    config = current_app.config
     try:
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        message = twilio_client.messages.create(
-            from_=TWILIO_PHONE_NUMBER,
-            to=CUSTOMER_PHONE_NUMBER,
-            body=body_text
+        twilio_client = get_twilio_client()
+        message = current_app.extensions["retry_policies"]["twilio"].call(
+            lambda: twilio_client.messages.create(
+                from_=config["TWILIO_PHONE_NUMBER"],
+                to=config["CUSTOMER_PHONE_NUMBER"],
+                body=body_text
+            ),
+            retryable=_twilio_retryable,
         )
         print(f"✅ SMS sent successfully! Message SID: {message.sid}")
         return True, message.sid
@@ -35,93 +186,194 @@ def send_sms(body_text):
         print(f"❌ Error sending SMS: {str(e)}")
         return False, str(e)
 
-@app.route("/verify-twilio")
+@bp.before_request
+def start_deadline():
+    """Starts the request's deadline: the route's, shortened by X-Request-Timeout"""
+    view = current_app.view_functions.get(request.endpoint)
+    seconds = getattr(view, "deadline", current_app.config["REQUEST_DEADLINE"])
+    try:
+        seconds = min(seconds, float(request.headers.get(deadlines.DEADLINE_HEADER, seconds)))
+    except ValueError:
+        pass
+    g.deadline_token = deadlines.start(seconds)
+
+@bp.before_app_request
+def start_checkout_pool():
+    """Starts this worker's pool refill if the post_fork hook has not (no preload, dev server)"""
+    pool = current_app.extensions.get("checkout_pool")
+    if pool is not None:
+        pool.start()
+
+@bp.teardown_request
+def end_deadline(exc):
+    if "deadline_token" in g:
+        deadlines.reset(g.pop("deadline_token"))
+
+@bp.route("/verify-twilio")
 def verify_twilio():
     """Endpoint to verify Twilio credentials and phone numbers"""
+    config = current_app.config
     try:
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        account = twilio_client.api.accounts(TWILIO_ACCOUNT_SID).fetch()
+        twilio_client = get_twilio_client()
+        account = twilio_client.api.accounts(config["TWILIO_ACCOUNT_SID"]).fetch()
         return jsonify({
             "status": "success",
             "account_status": account.status,
-            "twilio_phone": TWILIO_PHONE_NUMBER,
-            "customer_phone": CUSTOMER_PHONE_NUMBER
+            "twilio_phone": config["TWILIO_PHONE_NUMBER"],
+            "customer_phone": config["CUSTOMER_PHONE_NUMBER"]
         })
     except Exception as e:
         return jsonify({"status": "error", "error": str(e)}), 400
 
-@app.route("/")
+@bp.route("/")
 def home():
-    return render_template("index.html", key=os.getenv("STRIPE_PUBLIC_KEY"))
+    return render_template("index.html")
 
-@app.route("/pay", methods=["POST"])
+def _is_form_post():
+    return request.mimetype in ("application/x-www-form-urlencoded", "multipart/form-data")
+
+def _checkout_response(session_id, url):
+    if _is_form_post():
+        return redirect(url, code=303)
+    return jsonify({"id": session_id, "url": url})
+
+def _create_checkout_session(stripe, item, order_id, expires_at=None):
+    """Creates the Stripe Checkout Session for one order of a CATALOG item"""
+    config = current_app.config
+    product = CATALOG[item]
+
+    # Create metadata for both session and payment intent
+    metadata = {
+        "customer_phone": config["CUSTOMER_PHONE_NUMBER"],
+        "order_id": order_id
+    }
+    params = {}
+    if expires_at is not None:
+        params["expires_at"] = expires_at
+
+    return stripe.checkout.Session.create(
+        payment_method_types=["card"],
+        line_items=[{
+            "price_data": {
+                "currency": product["currency"],
+                "product_data": {
+                    "name": product["name"],
+                    "description": product["description"]
+                },
+                "unit_amount": product["amount"],
+            },
+            "quantity": 1,
+        }],
+        mode="payment",
+        # Stripe fills in the session id, which the success page uses to follow the order
+        success_url="http://localhost:5000/success?session_id={CHECKOUT_SESSION_ID}",
+        cancel_url="http://localhost:5000/cancel",
+        metadata=metadata,
+        payment_intent_data={
+            "metadata": metadata
+        },
+        **params
+    )
+
+def _create_pooled_session(app, item, order_id, expires_at):
+    """Session factory for the checkout pool's refill thread"""
+    with app.app_context():
+        return _create_checkout_session(get_stripe(), item, order_id, expires_at)
+
+@bp.route("/pay", methods=["POST"])
+@deadlines.deadline(10)
 def pay():
-    """Creates a Stripe checkout session"""
-    success_url = "http://localhost:5000/success"
-    cancel_url = "http://localhost:5000/cancel"
+    """Creates a Stripe checkout session
+
+    A form post from the payment page is redirected (303) straight to the
+    hosted checkout page; API callers get the session id and url as JSON.
+    """
+    config = current_app.config
+    stripe = get_stripe()
+    item = "premium"
+    product = CATALOG[item]
+
+    # A pre-created session costs no Stripe call, so it skips admission too
+    pool = current_app.extensions.get("checkout_pool")
+    if pool is not None:
+        pooled = pool.claim(item)
+        if pooled is not None:
+            get_aggregates().record_session()
+            print(f"✅ Pre-created session {pooled['session_id']} for order {pooled['order_id']}")
+            return _checkout_response(pooled["session_id"], pooled["url"])
 
+    limiter = current_app.extensions["checkout_limiter"]
+    permit = limiter.try_acquire()
+    if permit is None:
+        print("❌ Too many checkouts in progress, shedding request")
+        return jsonify({"error": "Too many checkouts in progress, try again shortly"}), 503, {
+            "Retry-After": str(limiter.retry_after())
+        }
+
+    started = time.monotonic()
     try:
         print("\n=== Creating Payment Session ===")
         
         # Generate a unique order ID
         order_id = "ORD" + os.urandom(4).hex()
         print(f"Generated Order ID: {order_id}")
-        print(f"Customer Phone: {CUSTOMER_PHONE_NUMBER}")
+        print(f"Customer Phone: {config['CUSTOMER_PHONE_NUMBER']}")
         
-        # Create metadata for both session and payment intent
-        metadata = {
-            "customer_phone": CUSTOMER_PHONE_NUMBER,
-            "order_id": order_id
-        }
-        
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": "Premium Package",
-                        "description": "Access to all premium features"
-                    },
-                    "unit_amount": 5000,  # $50.00
-                },
-                "quantity": 1,
-            }],
-            mode="payment",
-            success_url=success_url,
-            cancel_url=cancel_url,
-            metadata=metadata,
-            payment_intent_data={
-                "metadata": metadata
-            }
-        )
+        session = _create_checkout_session(stripe, item, order_id)
+        permit.release(time.monotonic() - started)
         
+        get_ledger().record_order(order_id, session.id, product["amount"], product["currency"])
+        get_aggregates().record_session()
+
         print(f"✅ Session created successfully! Session ID: {session.id}")
         print(f"✅ Order ID: {order_id}")
-        return jsonify({"id": session.id})
+        return _checkout_response(session.id, session.url)
     except Exception as e:
         print(f"❌ Error creating session: {str(e)}")
-        return jsonify({"error": str(e)}), 400
+        overloaded = deadlines.expired() or isinstance(e, (stripe.APIConnectionError, stripe.RateLimitError))
+        permit.release(time.monotonic() - started, overloaded=overloaded)
+        return jsonify({"error": str(e)}), 504 if deadlines.expired() else 400
+    finally:
+        permit.release()
 
-@app.route("/webhook", methods=["POST"])
+@bp.route("/webhook", methods=["POST"])
+@deadlines.deadline(15)
 def webhook():
     """Handles Stripe Webhook events"""
+    config = current_app.config
+    stripe = get_stripe()
     print("\n=== Webhook Request Received ===")
     print("Headers:", dict(request.headers))
-    payload = request.get_data(as_text=True)
-    print("Raw Payload:", payload)
     sig_header = request.headers.get("Stripe-Signature")
-    webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    webhook_secret = config["STRIPE_WEBHOOK_SECRET"]
     
     print(f"Webhook Secret from env: {webhook_secret}")
     print(f"Signature from Stripe: {sig_header}")
 
     try:
-        # Validate Stripe webhook signature
-        event = stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
+        # Validate Stripe webhook signature while the body is read, without
+        # buffering it as text. Handlers only read the event, so it is parsed
+        # into plain dicts instead of a StripeObject tree, which carries
+        # several bookkeeping sets and a requestor per nested object
+        from webhook_signature import read_verified
+        payload = read_verified(
+            request.stream, request.content_length, sig_header, webhook_secret,
+            stripe.Webhook.DEFAULT_TOLERANCE, max_bytes=config["WEBHOOK_MAX_BYTES"],
+        )
+        print(f"Raw Payload: {len(payload)} bytes")
+        event = json.loads(payload)
         print(f"\n✅ Webhook verified: {event['type']}")
         print(f"Event ID: {event['id']}")
         print(f"Event created: {event['created']}")
+
+        # Keep the event as received; losing it must not fail the webhook
+        try:
+            get_event_archive().append(event["id"], event["type"], event["created"], payload)
+        except Exception as e:
+            print(f"❌ Failed to archive event: {str(e)}")
+
+        # Drop cached copies of whatever this event changed
+        get_stripe_cache().handle_event(event)
         
         # Handle successful payment events
         if event["type"] == "checkout.session.completed":
@@ -141,7 +393,11 @@ def webhook():
             message = f"Your order no: #{order_id} is confirmed and payment done successful"
             print(f"Attempting to send SMS: {message}")
             
+            if get_ledger().mark_paid(order_id, session.get("payment_intent")):
+                get_aggregates().record_payment(session.get("amount_total"), session.get("currency"))
+            get_order_status().publish(get_ledger().get_order(order_id))
             success, result = send_sms(message)
+            get_ledger().record_notification(order_id, event["id"], success, result)
             if success:
                 print(f"✅ SMS sent successfully! SID: {result}")
             else:
@@ -161,7 +417,11 @@ def webhook():
             message = f"Your order no: #{order_id} is confirmed and payment done successful"
             print(f"Attempting to send SMS: {message}")
             
+            if get_ledger().mark_paid(order_id, payment_intent["id"]):
+                get_aggregates().record_payment(payment_intent.get("amount_received"), payment_intent.get("currency"))
+            get_order_status().publish(get_ledger().get_order(order_id))
             success, result = send_sms(message)
+            get_ledger().record_notification(order_id, event["id"], success, result)
             if success:
                 print(f"✅ SMS sent successfully! SID: {result}")
             else:
@@ -175,6 +435,10 @@ def webhook():
     except stripe.error.SignatureVerificationError as e:
         print(f"❌ Webhook signature verification failed: {str(e)}")
         return jsonify({"error": "Invalid signature"}), 400
+
+    except RequestEntityTooLarge as e:
+        print(f"❌ Webhook body too large: {e.description}")
+        return jsonify({"error": e.description}), 413
         
     except Exception as e:
         print(f"❌ Webhook error: {str(e)}")
@@ -182,38 +446,57 @@ def webhook():
         print(f"Error details: {e.__dict__ if hasattr(e, '__dict__') else 'No additional details'}")
         return jsonify({"error": str(e)}), 400
 
-@app.route("/success")
+@bp.route("/success")
 def success():
     return render_template("success.html")
 
-@app.route("/cancel")
+@bp.route("/order/<order_id>")
+def order_status(order_id):
+    """Status of an order, by order id or Checkout Session id, from local records only"""
+    order = get_order_status().lookup(get_ledger(), order_id)
+    if order is None:
+        return jsonify({"error": "Order not found"}), 404
+    return jsonify(public_order(order))
+
+@bp.route("/order/<order_id>/events")
+def order_events(order_id):
+    """Server-sent events with the order's status, pushed as soon as the webhook lands"""
+    stream = get_order_status().stream(get_ledger(), order_id)
+    return Response(
+        stream_with_context(stream),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@bp.route("/cancel")
 def cancel():
     return render_template("cancel.html")
 
-@app.route("/test-sms")
+@bp.route("/test-sms")
 def test_sms():
+    config = current_app.config
     try:
         # First verify the phone numbers
-        print(f"Testing with: From={TWILIO_PHONE_NUMBER}, To={CUSTOMER_PHONE_NUMBER}")
+        print(f"Testing with: From={config['TWILIO_PHONE_NUMBER']}, To={config['CUSTOMER_PHONE_NUMBER']}")
         
         # Create Twilio client
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        twilio_client = get_twilio_client()
         
         # Check if the number is verified
         verified_numbers = twilio_client.outgoing_caller_ids.list()
-        is_verified = any(number.phone_number == CUSTOMER_PHONE_NUMBER for number in verified_numbers)
+        is_verified = any(number.phone_number == config["CUSTOMER_PHONE_NUMBER"] for number in verified_numbers)
         
         if not is_verified:
             return jsonify({
                 "error": "Phone number is not verified",
                 "message": "Please verify your phone number in Twilio console first",
-                "number": CUSTOMER_PHONE_NUMBER
+                "number": config["CUSTOMER_PHONE_NUMBER"]
             }), 400
             
         # Try to send the message
         message = twilio_client.messages.create(
-            from_=TWILIO_PHONE_NUMBER,
-            to=CUSTOMER_PHONE_NUMBER,
+            from_=config["TWILIO_PHONE_NUMBER"],
+            to=config["CUSTOMER_PHONE_NUMBER"],
             body="This is a test SMS from your Flask application"
         )
         
@@ -222,8 +505,8 @@ def test_sms():
             "message": "SMS sent successfully!",
             "details": {
                 "message_sid": message.sid,
-                "to": CUSTOMER_PHONE_NUMBER,
-                "from": TWILIO_PHONE_NUMBER,
+                "to": config["CUSTOMER_PHONE_NUMBER"],
+                "from": config["TWILIO_PHONE_NUMBER"],
                 "is_verified": True
             }
         })
@@ -232,12 +515,12 @@ def test_sms():
             "status": "error",
             "error": str(e),
             "details": {
-                "to": CUSTOMER_PHONE_NUMBER,
-                "from": TWILIO_PHONE_NUMBER
+                "to": config["CUSTOMER_PHONE_NUMBER"],
+                "from": config["TWILIO_PHONE_NUMBER"]
             }
         }), 400
 
-@app.route("/test-webhook", methods=["POST"])
+@bp.route("/test-webhook", methods=["POST"])
 def test_webhook():
     """Test endpoint for webhook verification"""
     print("\n=== Test Webhook Received ===")
@@ -253,37 +536,38 @@ def test_webhook():
     
     return jsonify({"status": "success"}), 200
 
-@app.route("/test-sms-detailed")
+@bp.route("/test-sms-detailed")
 def test_sms_detailed():
     """Endpoint to test SMS with detailed error reporting"""
+    config = current_app.config
     try:
         # First verify Twilio credentials
-        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
+        if not config["TWILIO_ACCOUNT_SID"] or not config["TWILIO_AUTH_TOKEN"]:
             return jsonify({
                 "status": "error",
                 "error": "Missing Twilio credentials",
                 "details": {
-                    "account_sid": "❌ Missing" if not TWILIO_ACCOUNT_SID else "✅ Present",
-                    "auth_token": "❌ Missing" if not TWILIO_AUTH_TOKEN else "✅ Present"
+                    "account_sid": "❌ Missing" if not config["TWILIO_ACCOUNT_SID"] else "✅ Present",
+                    "auth_token": "❌ Missing" if not config["TWILIO_AUTH_TOKEN"] else "✅ Present"
                 }
             }), 400
 
-        if not TWILIO_PHONE_NUMBER or not CUSTOMER_PHONE_NUMBER:
+        if not config["TWILIO_PHONE_NUMBER"] or not config["CUSTOMER_PHONE_NUMBER"]:
             return jsonify({
                 "status": "error",
                 "error": "Missing phone numbers",
                 "details": {
-                    "twilio_phone": "❌ Missing" if not TWILIO_PHONE_NUMBER else "✅ Present",
-                    "customer_phone": "❌ Missing" if not CUSTOMER_PHONE_NUMBER else "✅ Present"
+                    "twilio_phone": "❌ Missing" if not config["TWILIO_PHONE_NUMBER"] else "✅ Present",
+                    "customer_phone": "❌ Missing" if not config["CUSTOMER_PHONE_NUMBER"] else "✅ Present"
                 }
             }), 400
 
         # Initialize Twilio client
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        twilio_client = get_twilio_client()
         
         # Verify account status
         try:
-            account = twilio_client.api.accounts(TWILIO_ACCOUNT_SID).fetch()
+            account = twilio_client.api.accounts(config["TWILIO_ACCOUNT_SID"]).fetch()
             account_status = account.status
         except Exception as e:
             return jsonify({
@@ -295,8 +579,8 @@ def test_sms_detailed():
         # Try to send test message
         try:
             message = twilio_client.messages.create(
-                from_=TWILIO_PHONE_NUMBER,
-                to=CUSTOMER_PHONE_NUMBER,
+                from_=config["TWILIO_PHONE_NUMBER"],
+                to=config["CUSTOMER_PHONE_NUMBER"],
                 body="This is a test message from your Flask application. If you receive this, your SMS setup is working!"
             )
             
@@ -306,8 +590,8 @@ def test_sms_detailed():
                 "details": {
                     "message_sid": message.sid,
                     "account_status": account_status,
-                    "twilio_phone": TWILIO_PHONE_NUMBER,
-                    "customer_phone": CUSTOMER_PHONE_NUMBER
+                    "twilio_phone": config["TWILIO_PHONE_NUMBER"],
+                    "customer_phone": config["CUSTOMER_PHONE_NUMBER"]
                 }
             })
         except Exception as e:
@@ -325,5 +609,189 @@ def test_sms_detailed():
             "details": str(e)
         }), 500
 
+@bp.route("/healthz")
+def healthz():
+    """Liveness check; never shed and makes no outbound calls"""
+    return jsonify({"status": "ok"})
+
+@bp.route("/stats")
+def stats():
+    """Checkouts, payments, gross and conversion over the last hour, day and 30 days"""
+    return jsonify(get_aggregates().snapshot())
+
+def _check_token():
+    """None if the request carries EXPORT_TOKEN as its bearer token, else the error response"""
+    token = current_app.config["EXPORT_TOKEN"]
+    if not token:
+        return jsonify({"error": "Disabled; set EXPORT_TOKEN or use the flask command"}), 404
+    authorization = request.headers.get("Authorization", "").encode()
+    if not hmac.compare_digest(authorization, ("Bearer " + token).encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+def _analytics(source, days, bucket, percentiles, refresh=False, rebuild=True):
+    """Columns of source and their summary over the last days, rebuilt first if stale and rebuild is set"""
+    import analytics
+    config = current_app.config
+    columns = analytics.load(
+        config["ANALYTICS_DIR"], source, ledger=get_ledger(), archive=get_event_archive(),
+        max_age=config["ANALYTICS_MAX_AGE"], refresh=refresh, rebuild=rebuild,
+    )
+    start = int(time.time()) - days * 86400 if days else None
+    return columns, columns.summarize(start=start, bucket=bucket, percentiles=percentiles)
+
+@bp.route("/analytics")
+def analytics_report():
+    """Count, total, mean and percentiles of amounts per currency and status
+
+    Served from the columns the analytics command last built, however old:
+    a rebuild reads every row, which is no job for a request thread.
+    """
+    from analytics import AnalyticsUnavailable, BUCKETS, SOURCES
+    denied = _check_token()
+    if denied:
+        return denied
+    source = request.args.get("source", "ledger")
+    bucket = request.args.get("bucket")
+    if source not in SOURCES or (bucket and bucket not in BUCKETS):
+        return jsonify({"error": f"source must be one of {SOURCES}, bucket one of {tuple(BUCKETS)}"}), 400
+    try:
+        days = request.args.get("days", 30, type=int)
+        percentiles = [float(p) for p in request.args.get("percentiles", "50,90,99").split(",") if p]
+        columns, groups = _analytics(source, days, bucket, percentiles, rebuild=False)
+    except AnalyticsUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "source": source, "days": days, "bucket": bucket,
+        "built_at": columns.meta["built_at"], "groups": groups,
+    })
+
+@bp.route("/export/<source>")
+@deadlines.deadline(3600)
+def export_rows(source):
+    """Streams orders, checkout sessions or payment intents as CSV or NDJSON"""
+    import export
+    denied = _check_token()
+    if denied:
+        return denied
+
+    format = request.args.get("format", "csv")
+    # Each day of Stripe objects is pages of list calls, so bound the period
+    days = max(1, min(request.args.get("days", 30, type=int), current_app.config["EXPORT_MAX_DAYS"]))
+    compress = request.args.get("gzip") == "1"
+    if source not in export.SOURCES or format not in export.FORMATS:
+        return jsonify({"error": f"source must be one of {export.SOURCES}, format one of {tuple(export.FORMATS)}"}), 400
+    if source != "orders":
+        get_stripe()
+
+    end = int(time.time()) + 1
+    chunks = export.export(source, format, end - days * 86400, end, ledger=get_ledger(), compress=compress)
+    filename = f"{source}.{format}" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(chunks),
+        mimetype="application/gzip" if compress else export.FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@bp.route("/cache-stats")
+def cache_stats():
+    """Hit ratio and size of the Stripe object cache in this worker"""
+    import stripe_singleflight
+    stats = dict(get_stripe_cache().stats(), singleflight=stripe_singleflight.stats())
+    stats["admission"] = current_app.extensions["checkout_limiter"].stats()
+    stats["retries"] = {name: policy.stats() for name, policy in current_app.extensions["retry_policies"].items()}
+    if current_app.config["STRIPE_HEDGING"]:
+        import stripe_hedging
+        stats["hedging"] = stripe_hedging.stats()
+    if "checkout_pool" in current_app.extensions:
+        stats["checkout_pool"] = current_app.extensions["checkout_pool"].stats()
+    return jsonify(stats)
+
+@bp.cli.command("reconcile")
+@click.option("--hours", default=24, show_default=True, help="How far back to reconcile")
+@click.option("--window", default=DEFAULT_WINDOW_SECONDS, show_default=True, help="Window size in seconds")
+@click.option("--workers", default=4, show_default=True, help="Windows fetched in parallel")
+def reconcile_command(hours, window, workers):
+    """Reports paid checkouts that did not produce a confirmation"""
+    end = int(time.time())
+    start = end - hours * 3600
+    print(f"\n=== Reconciling orders from the last {hours}h ===")
+    get_stripe()
+
+    counts = {}
+    for mismatch in reconcile(
+        get_ledger(), start, end, window_seconds=window, max_workers=workers, cache=get_stripe_cache()
+    ):
+        counts[mismatch["type"]] = counts.get(mismatch["type"], 0) + 1
+        print(json.dumps(mismatch))
+
+    if counts:
+        for kind, count in sorted(counts.items()):
+            print(f"❌ {kind}: {count}")
+    else:
+        print("✅ No mismatches found")
+    print(f"Stripe cache: {json.dumps(get_stripe_cache().stats()['types'])}")
+
+@bp.cli.command("archive")
+@click.option("--id", "event_id", help="Print a single event")
+@click.option("--hours", default=24, show_default=True, help="How far back to print events")
+@click.option("--type", "event_type", help="Only events of this type")
+@click.option("--prune", is_flag=True, help="Delete segments older than EVENT_ARCHIVE_RETENTION_DAYS instead")
+def archive_command(event_id, hours, event_type, prune):
+    """Prints archived webhook events as NDJSON"""
+    archive = get_event_archive()
+    if prune:
+        days = current_app.config["EVENT_ARCHIVE_RETENTION_DAYS"]
+        if not days:
+            raise click.ClickException("EVENT_ARCHIVE_RETENTION_DAYS is 0; nothing is pruned")
+        pruned = archive.prune(time.time() - days * 86400)
+        print(f"✅ Deleted {pruned} archive segments older than {days} days")
+        return
+    if event_id:
+        payload = archive.get(event_id)
+        if payload is None:
+            raise click.ClickException(f"Event {event_id} is not in the archive")
+        click.echo(payload.decode("utf-8"))
+        return
+
+    end = int(time.time()) + 1
+    for _, _, _, payload in archive.iter_range(end - hours * 3600, end, event_type):
+        click.echo(payload.decode("utf-8"))
+
+@bp.cli.command("analytics")
+@click.option("--source", type=click.Choice(["ledger", "archive"]), default="ledger", show_default=True)
+@click.option("--days", default=30, show_default=True, help="How far back to look; 0 for everything")
+@click.option("--bucket", type=click.Choice(["hour", "day", "month"]), help="Break down by period")
+@click.option("--percentiles", default="50,90,99", show_default=True, help="Amount percentiles per group")
+@click.option("--refresh", is_flag=True, help="Rebuild the columns even if they are fresh")
+def analytics_command(source, days, bucket, percentiles, refresh):
+    """Prints payment totals per currency and status as NDJSON"""
+    from analytics import AnalyticsUnavailable
+    try:
+        _, groups = _analytics(source, days, bucket, [float(p) for p in percentiles.split(",") if p], refresh)
+    except AnalyticsUnavailable as e:
+        raise click.ClickException(str(e))
+    for group in groups:
+        click.echo(json.dumps(group))
+
+@bp.cli.command("export")
+@click.argument("source", type=click.Choice(["orders", "checkout_sessions", "payment_intents"]))
+@click.option("--format", "format", type=click.Choice(["csv", "ndjson"]), default="csv", show_default=True)
+@click.option("--days", default=30, show_default=True, help="How far back to export")
+@click.option("--gzip", "compress", is_flag=True, help="Compress the output")
+@click.option("--output", "-o", default="-", help="File to write; stdout by default")
+def export_command(source, format, days, compress, output):
+    """Writes orders or Stripe payments as CSV or NDJSON without holding them in memory"""
+    import export
+    if source != "orders":
+        get_stripe()
+    end = int(time.time()) + 1
+    with click.open_file(output, "wb") as f:
+        for chunk in export.export(source, format, end - days * 86400, end, ledger=get_ledger(), compress=compress):
+            f.write(chunk)
+
 if __name__ == "__main__":
-    app.run(port=5000, debug=True)
+    # Development server only; production runs wsgi:app under gunicorn
+    create_app().run(port=5000, debug=os.getenv("FLASK_DEBUG") == "1")
@@ -0,0 +1,142 @@
+"""Simulates a Stripe brownout with and without admission control on /pay
+
+Usage: python benchmarks/admission.py [--rate 150] [--seconds 9] [--threads 48]
+
+Checkouts arrive at --rate per second and are served by a pool of --threads
+(a gunicorn worker's threads, or several workers' worth). Each one waits
+for a thread and then for the Stripe stand-in, and only counts as served if
+it finishes within DEADLINE seconds of arriving.
+
+The stand-in shares its capacity among the calls in progress: each takes
+BASE_LATENCY while fewer than `capacity` are running, and proportionally
+longer beyond that. For the middle third of the run, capacity drops from
+NORMAL_CAPACITY to BROWNOUT_CAPACITY. A caller whose deadline passes gives
+up and its call is dropped.
+
+Without a limit, the queue and Stripe's share of work grow until almost
+every call misses its deadline. With AdaptiveLimiter the excess is refused
+at once (a 503 in the app) and goodput stays near the reduced capacity.
+Times are scaled down so the run takes seconds.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admission
+
+BASE_LATENCY = 0.05
+NORMAL_CAPACITY = 16
+BROWNOUT_CAPACITY = 4
+DEADLINE = 0.5
+TICK = 0.002
+
+
+class StandInStripe:
+    """Processor-sharing server: n calls each progress at min(1, capacity / n)"""
+
+    def __init__(self):
+        self.capacity = NORMAL_CAPACITY
+        self.jobs = {}  # event -> work left in seconds
+        self.lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        last = time.monotonic()
+        while self.running:
+            time.sleep(TICK)
+            now = time.monotonic()
+            with self.lock:
+                if self.jobs:
+                    rate = min(1.0, self.capacity / len(self.jobs))
+                    for done, left in list(self.jobs.items()):
+                        left -= (now - last) * rate
+                        if left <= 0:
+                            del self.jobs[done]
+                            done.set()
+                        else:
+                            self.jobs[done] = left
+            last = now
+
+    def call(self, timeout):
+        """True if the call finished within timeout"""
+        done = threading.Event()
+        with self.lock:
+            self.jobs[done] = BASE_LATENCY
+        if done.wait(timeout):
+            return True
+        with self.lock:
+            self.jobs.pop(done, None)
+        return False
+
+
+def simulate(args, limiter):
+    stripe = StandInStripe()
+    phases = [{"served": 0, "late": 0, "rejected": 0} for _ in range(3)]
+    lock = threading.Lock()
+    start = time.monotonic()
+
+    def checkout(arrived, phase):
+        def count(name):
+            with lock:
+                phases[phase][name] += 1
+
+        permit = limiter.try_acquire() if limiter else None
+        if limiter and permit is None:
+            count("rejected")
+            return
+        left = DEADLINE - (time.monotonic() - arrived)
+        called = time.monotonic()
+        ok = left > 0 and stripe.call(left)
+        if permit is not None:
+            permit.release(time.monotonic() - called, overloaded=not ok)
+        count("served" if ok else "late")
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        n = 0
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= args.seconds:
+                break
+            phase = min(2, int(3 * elapsed / args.seconds))
+            stripe.capacity = BROWNOUT_CAPACITY if phase == 1 else NORMAL_CAPACITY
+            pool.submit(checkout, time.monotonic(), phase)
+            n += 1
+            time.sleep(max(0.0, start + n / args.rate - time.monotonic()))
+    stripe.running = False
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=150)
+    parser.add_argument("--seconds", type=float, default=9)
+    parser.add_argument("--threads", type=int, default=48)
+    args = parser.parse_args()
+
+    # Compress the limiter's baseline window along with everything else
+    admission.BASELINE_WINDOW = args.seconds / 6
+
+    print(f"\n=== {args.rate:.0f} checkouts/s, {args.threads} threads, "
+          f"capacity {NORMAL_CAPACITY} -> {BROWNOUT_CAPACITY} -> {NORMAL_CAPACITY} ===")
+    third = args.seconds / 3
+    limiters = (("no limit", None), ("adaptive", admission.AdaptiveLimiter(max_limit=args.threads - 8)))
+    for label, limiter in limiters:
+        phases = simulate(args, limiter)
+        cells = "  ".join(
+            f"{name}: {p['served'] / third:5.1f}/s served, {p['late'] / third:5.1f}/s late, "
+            f"{p['rejected'] / third:5.1f}/s shed"
+            for name, p in zip(("before", "brownout", "after"), phases)
+        )
+        print(f"{label:9} {cells}")
+        if limiter:
+            print(f"          {limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
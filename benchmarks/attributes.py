@@ -0,0 +1,88 @@
+"""Times StripeObject construction and attribute reads with and without stripe_speedups
+
+Usage: python benchmarks/attributes.py [--events 100] [--lines 50]
+
+Builds the same event list as benchmarks/convert.py, checks that both paths
+leave identical values and bookkeeping (_unsaved_values, _transient_values,
+_previous) on every object, then times construction and a handler-style
+walk that reads several fields of every line item by attribute.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+from stripe._util import convert_to_stripe_object
+
+import stripe_speedups
+from convert import make_event_list
+
+
+def state(obj):
+    """Values plus StripeObject bookkeeping, used to compare both paths"""
+    if isinstance(obj, dict):
+        return (
+            type(obj).__name__,
+            sorted(getattr(obj, "_unsaved_values", ())),
+            sorted(getattr(obj, "_transient_values", ())),
+            getattr(obj, "_previous", None),
+            {k: state(v) for k, v in obj.items()},
+        )
+    if isinstance(obj, list):
+        return [state(v) for v in obj]
+    return obj
+
+
+def read_fields(events):
+    total = 0
+    for event in events.data:
+        invoice = event.data.object
+        for line in invoice.lines.data:
+            if line.metadata.order_id and line.currency == invoice.currency:
+                total += line.amount + line.price.unit_amount + line.period.end - line.period.start
+    return total
+
+
+def best_time(fn):
+    runs, _ = timeit.Timer(fn).autorange()
+    return min(timeit.repeat(fn, number=runs, repeat=5)) / runs
+
+
+def measure(payload):
+    convert = lambda: convert_to_stripe_object(payload, api_key="sk_test_benchmark")
+    events = convert()
+
+    # Exercise writes too, so __setitem__ bookkeeping is compared
+    events.data[0].data.object.customer.metadata["note"] = "benchmark"
+    events.data[0].description = "benchmark"
+
+    return state(events), read_fields(events), best_time(convert), best_time(lambda: read_fields(events))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--lines", type=int, default=50)
+    args = parser.parse_args()
+
+    stripe.api_key = "sk_test_benchmark"
+    payload = make_event_list(args.events, args.lines)
+
+    stock_state, stock_total, stock_build, stock_read = measure(payload)
+    stripe_speedups.install()
+    fast_state, fast_total, fast_build, fast_read = measure(payload)
+
+    if fast_state != stock_state or fast_total != stock_total:
+        print("❌ stripe_speedups leaves different values or bookkeeping")
+        sys.exit(1)
+
+    print(f"\n=== {args.events} events x {args.lines} invoice lines ===")
+    print(f"construct  stripe {stock_build * 1e3:8.2f} ms   stripe_speedups {fast_build * 1e3:8.2f} ms  ({stock_build / fast_build:.2f}x)")
+    print(f"read       stripe {stock_read * 1e3:8.2f} ms   stripe_speedups {fast_read * 1e3:8.2f} ms  ({stock_read / fast_read:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Time from opening the payment page to navigating to Stripe Checkout
+
+Usage: python benchmarks/checkout_flow.py [--requests 50] [--rtt-ms 80] [--stripe-js-ms 250]
+
+Compares the two ways the payment page can reach checkout:
+
+- js:   GET /, load Stripe.js (render-blocking, --stripe-js-ms), fetch POST
+        /pay for JSON, then stripe.redirectToCheckout, which asks Stripe for
+        the session before navigating (--redirect-ms)
+- form: GET /, form POST /pay, follow the 303 to session.url
+
+Requests run through the app itself, with checkout session creation served
+by an in-process stand-in for Stripe that takes --stripe-ms. Each browser
+round trip adds --rtt-ms. The network figures are assumptions about a
+typical visitor; the server time is measured.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+
+from app import create_app
+
+
+class StandInStripe(stripe.HTTPClient):
+    name = "stand-in"
+
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        time.sleep(self.seconds)
+        session_id = "cs_test_" + os.urandom(8).hex()
+        body = json.dumps({
+            "id": session_id,
+            "object": "checkout.session",
+            "url": "https://checkout.stripe.com/c/pay/" + session_id,
+        })
+        return body, 200, {"Request-Id": "req_" + os.urandom(6).hex()}
+
+    def close(self):
+        pass
+
+
+def checkout(client, mode, args):
+    """Seconds until the browser would start navigating to checkout"""
+    rtt = args.rtt_ms / 1000
+    start = time.perf_counter()
+    time.sleep(rtt)
+    assert client.get("/").status_code == 200
+
+    if mode == "js":
+        time.sleep(args.stripe_js_ms / 1000)
+        time.sleep(rtt)
+        response = client.post("/pay", json={})
+        assert response.status_code == 200 and response.get_json()["id"]
+        time.sleep(args.redirect_ms / 1000)
+    else:
+        time.sleep(rtt)
+        response = client.post("/pay", content_type="application/x-www-form-urlencoded")
+        assert response.status_code == 303 and response.location.startswith("https://checkout.stripe.com/")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=80)
+    parser.add_argument("--stripe-js-ms", type=float, default=250)
+    parser.add_argument("--redirect-ms", type=float, default=100)
+    parser.add_argument("--stripe-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    stripe.default_http_client = StandInStripe(args.stripe_ms / 1000)
+    scratch = tempfile.mkdtemp()
+    app = create_app({
+        "STRIPE_API_KEY": "sk_test_benchmark",
+        "ORDER_DB_PATH": ":memory:",
+        "AGGREGATES_PATH": os.path.join(scratch, "aggregates.bin"),
+        "EVENT_ARCHIVE_DIR": os.path.join(scratch, "events"),
+    })
+    client = app.test_client()
+
+    print(f"\n=== {args.requests} checkouts, {args.rtt_ms:.0f}ms RTT, Stripe {args.stripe_ms:.0f}ms ===")
+    results = {}
+    for mode in ("js", "form"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples = sorted(checkout(client, mode, args) for _ in range(args.requests))
+        results[mode] = statistics.median(samples)
+        p90 = samples[int(0.9 * (len(samples) - 1))]
+        print(f"{mode:5} p50 {results[mode] * 1e3:7.1f} ms  p90 {p90 * 1e3:7.1f} ms")
+    print(f"form saves {(results['js'] - results['form']) * 1e3:.1f} ms per checkout")
+
+
+if __name__ == "__main__":
+    main()
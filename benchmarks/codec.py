@@ -0,0 +1,62 @@
+"""Compares stripe_codec with pickle and JSON for caching StripeObjects
+
+Usage: python benchmarks/codec.py [--events 100] [--lines 50]
+
+Encodes the event list from benchmarks/convert.py three ways: stripe_codec,
+pickle (StripeObject.__reduce__) and JSON rebuilt with
+convert_to_stripe_object. Checks stripe_codec round-trips to the same classes
+and values, then reports entry size and encode/decode time for each.
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+from stripe._util import convert_to_stripe_object
+
+import stripe_codec
+from convert import make_event_list, shape
+
+
+def best_time(fn):
+    runs, _ = timeit.Timer(fn).autorange()
+    return min(timeit.repeat(fn, number=runs, repeat=5)) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--lines", type=int, default=50)
+    args = parser.parse_args()
+
+    stripe.api_key = "sk_test_benchmark"
+    events = convert_to_stripe_object(make_event_list(args.events, args.lines))
+
+    if shape(stripe_codec.loads(stripe_codec.dumps(events))) != shape(events):
+        print("❌ stripe_codec round trip changed the object tree")
+        sys.exit(1)
+
+    codecs = {
+        "stripe_codec": (stripe_codec.dumps, stripe_codec.loads),
+        "pickle": (lambda o: pickle.dumps(o, pickle.HIGHEST_PROTOCOL), pickle.loads),
+        "json": (
+            lambda o: json.dumps(o, separators=(",", ":")).encode("utf-8"),
+            lambda b: convert_to_stripe_object(json.loads(b)),
+        ),
+    }
+
+    print(f"\n=== {args.events} events x {args.lines} invoice lines ===")
+    for name, (dumps, loads) in codecs.items():
+        data = dumps(events)
+        encode = best_time(lambda: dumps(events))
+        decode = best_time(lambda: loads(data))
+        print(f"{name:13} {len(data) / 1024:9.1f} KiB   encode {encode * 1e3:8.2f} ms   decode {decode * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Times convert_to_stripe_object on large payloads with and without stripe_speedups
+
+Usage: python benchmarks/convert.py [--events 100] [--lines 50]
+
+Converts an event list page whose events each embed an invoice with
+expanded lines, checks that both paths build the same classes and values,
+and reports the time per conversion.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+from stripe._util import convert_to_stripe_object
+
+import stripe_speedups
+
+
+def make_event_list(events, lines):
+    def invoice(n):
+        return {
+            "id": f"in_{n:06d}",
+            "object": "invoice",
+            "amount_paid": 5000 * lines,
+            "currency": "usd",
+            "customer": {"id": f"cus_{n:06d}", "object": "customer", "metadata": {}},
+            "lines": {
+                "object": "list",
+                "url": f"/v1/invoices/in_{n:06d}/lines",
+                "has_more": False,
+                "data": [
+                    {
+                        "id": f"il_{n:06d}_{i:04d}",
+                        "object": "line_item",
+                        "amount": 5000,
+                        "currency": "usd",
+                        "price": {"id": "price_premium", "object": "price", "unit_amount": 5000},
+                        "period": {"start": 1700000000, "end": 1702592000},
+                        "metadata": {"order_id": f"ORD{n:04x}{i:04x}"},
+                    }
+                    for i in range(lines)
+                ],
+            },
+        }
+
+    return {
+        "object": "list",
+        "url": "/v1/events",
+        "has_more": False,
+        "data": [
+            {
+                "id": f"evt_{n:06d}",
+                "object": "event",
+                "type": "invoice.paid",
+                "created": 1700000000 + n,
+                "data": {"object": invoice(n)},
+            }
+            for n in range(events)
+        ],
+    }
+
+
+def shape(obj):
+    """(class, values) tree used to compare conversions"""
+    if isinstance(obj, dict):
+        return type(obj).__name__, {k: shape(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [shape(v) for v in obj]
+    return obj
+
+
+def best_time(fn):
+    runs, _ = timeit.Timer(fn).autorange()
+    return min(timeit.repeat(fn, number=runs, repeat=5)) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--lines", type=int, default=50)
+    args = parser.parse_args()
+
+    stripe.api_key = "sk_test_benchmark"
+    payload = make_event_list(args.events, args.lines)
+    convert = lambda: convert_to_stripe_object(payload, api_key="sk_test_benchmark")
+
+    expected = shape(convert())
+    stock = best_time(convert)
+
+    stripe_speedups.install()
+    if shape(convert()) != expected:
+        print("❌ stripe_speedups builds a different object tree")
+        sys.exit(1)
+    fast = best_time(convert)
+
+    print(f"\n=== {args.events} events x {args.lines} invoice lines ===")
+    print(f"stripe           {stock * 1e3:8.2f} ms per conversion")
+    print(f"stripe_speedups  {fast * 1e3:8.2f} ms per conversion  ({stock / fast:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Checks stripe_speedups' form encoder against stripe's and times both
+
+Usage: python benchmarks/encode.py [--cases 2000] [--line-items 100]
+
+First encodes randomly generated nested parameter dicts with both encoders
+and fails on the first case whose urlencoded body differs. Then times both
+on a checkout session create payload with many line items and metadata keys.
+"""
+import argparse
+import datetime
+import os
+import random
+import string
+import sys
+import timeit
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stripe._encode import _api_encode
+
+import stripe_speedups
+
+
+class FakeResource:
+    def __init__(self, stripe_id):
+        self.stripe_id = stripe_id
+
+
+def random_key(rng):
+    return "".join(rng.choice(string.ascii_lowercase + "_") for _ in range(rng.randint(1, 8)))
+
+
+def random_scalar(rng):
+    return rng.choice([
+        None,
+        "",
+        rng.randint(-10**6, 10**6),
+        rng.random(),
+        True,
+        False,
+        random_key(rng) + " &=[]ü",
+        datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(seconds=rng.randint(0, 10**7)),
+        FakeResource("cus_" + random_key(rng)),
+    ])
+
+
+def random_value(rng, depth):
+    kind = rng.random()
+    if depth <= 0 or kind < 0.5:
+        return random_scalar(rng)
+    if kind < 0.75:
+        return {random_key(rng): random_value(rng, depth - 1) for _ in range(rng.randint(0, 4))}
+    items = [random_value(rng, depth - 1) for _ in range(rng.randint(0, 4))]
+    return tuple(items) if rng.random() < 0.2 else items
+
+
+def stripe_body(params, api_mode):
+    # Mirrors _APIRequestor._args_for_request_with_retries
+    body = urlencode(list(_api_encode(params, api_mode)))
+    return body.replace("%5B", "[").replace("%5D", "]").encode("utf-8")
+
+
+def speedups_body(params, api_mode):
+    body = stripe_speedups.urlencode(list(stripe_speedups.api_encode(params, api_mode)))
+    return body.replace("%5B", "[").replace("%5D", "]").encode("utf-8")
+
+
+def check_equivalence(cases):
+    rng = random.Random(0)
+    for case in range(cases):
+        params = {random_key(rng): random_value(rng, 4) for _ in range(rng.randint(0, 6))}
+        for api_mode in ("V1", "V2"):
+            expected = stripe_body(params, api_mode)
+            actual = speedups_body(params, api_mode)
+            if expected != actual:
+                print(f"❌ case {case} ({api_mode}) differs\n  params: {params!r}")
+                print(f"  stripe:   {expected!r}\n  speedups: {actual!r}")
+                sys.exit(1)
+    print(f"✅ {cases} random cases encode byte-identically in V1 and V2 mode")
+
+
+def checkout_params(line_items):
+    return {
+        "payment_method_types": ["card"],
+        "line_items": [
+            {
+                "price_data": {
+                    "currency": "usd",
+                    "product_data": {
+                        "name": f"Item {i}",
+                        "description": "Access to all premium features",
+                        "metadata": {"sku": f"SKU{i:05d}"},
+                    },
+                    "unit_amount": 5000,
+                },
+                "quantity": 1,
+            }
+            for i in range(line_items)
+        ],
+        "mode": "payment",
+        "success_url": "http://localhost:5000/success",
+        "cancel_url": "http://localhost:5000/cancel",
+        "metadata": {f"key_{i}": f"value_{i}" for i in range(50)},
+        "payment_intent_data": {"metadata": {"order_id": "ORD1234abcd"}},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--line-items", type=int, default=100)
+    args = parser.parse_args()
+
+    check_equivalence(args.cases)
+
+    params = checkout_params(args.line_items)
+    print(f"\n=== checkout session with {args.line_items} line items, 50 metadata keys ===")
+    for label, build in (("stripe", stripe_body), ("stripe_speedups", speedups_body)):
+        runs, _ = timeit.Timer(lambda: build(params, "V1")).autorange()
+        best = min(timeit.repeat(lambda: build(params, "V1"), number=runs, repeat=5)) / runs
+        print(f"{label:16} {best * 1e6:9.1f} us per body")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Measures /pay's checkout session create with and without hedging
+
+Usage: python benchmarks/hedging.py [--requests 2000] [--concurrency 16] [--budget 0.05]
+
+Requests go through stripe.checkout.Session.create against an in-process
+stand-in for the Stripe API that models where latency comes from:
+
+- each way over the network takes ~10ms, but STALL_RATE of trips stall for
+  STALL_SECONDS (a lost packet or slow connection setup)
+- Stripe processes a given Idempotency-Key once, taking ~40ms and
+  occasionally SLOW_SECONDS; a duplicate arriving meanwhile gets a 409 and
+  one arriving afterwards gets the stored response
+
+so the numbers show what hedging can (network stalls) and cannot (slow
+processing) win back.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+
+import stripe_hedging
+
+NETWORK_SECONDS = 0.010
+STALL_RATE = 0.01
+STALL_SECONDS = 0.300
+PROCESSING_SECONDS = 0.040
+SLOW_RATE = 0.005
+SLOW_SECONDS = 0.250
+
+
+def network_trip():
+    base = random.uniform(0.5, 1.5) * NETWORK_SECONDS
+    return base + (STALL_SECONDS if random.random() < STALL_RATE else 0)
+
+
+class StandInStripe(stripe.HTTPClient):
+    name = "stand-in"
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.keys = {}  # idempotency key -> stored response, or None while processing
+        self.attempts = 0
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        with self.lock:
+            self.attempts += 1
+        time.sleep(network_trip())
+
+        key = headers.get("Idempotency-Key")
+        with self.lock:
+            first = key not in self.keys
+            if first:
+                self.keys[key] = None
+            stored = self.keys[key]
+
+        if first:
+            time.sleep(SLOW_SECONDS if random.random() < SLOW_RATE else random.uniform(0.8, 1.2) * PROCESSING_SECONDS)
+            body = json.dumps({"id": "cs_test_" + os.urandom(8).hex(), "object": "checkout.session"})
+            stored = (body, 200, {"Request-Id": "req_" + os.urandom(6).hex()})
+            with self.lock:
+                self.keys[key] = stored
+        elif stored is None:
+            body = json.dumps({"error": {"type": "idempotency_error", "message": "in progress"}})
+            stored = (body, 409, {})
+
+        time.sleep(network_trip())
+        return stored
+
+    def close(self):
+        pass
+
+
+def run(client, requests, concurrency):
+    stripe.default_http_client = client
+
+    def one(_):
+        start = time.perf_counter()
+        stripe.checkout.Session.create(mode="payment", success_url="http://localhost:5000/success")
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sorted(pool.map(one, range(requests)))
+
+
+def report(label, samples, attempts, requests):
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3
+    print(
+        f"{label:9} p50 {pick(0.5):7.1f} ms  p90 {pick(0.9):7.1f} ms  "
+        f"p99 {pick(0.99):7.1f} ms  p99.9 {pick(0.999):7.1f} ms  "
+        f"extra requests {100 * (attempts - requests) / requests:4.1f}%"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--budget", type=float, default=stripe_hedging.DEFAULT_BUDGET_RATIO)
+    parser.add_argument("--percentile", type=float, default=stripe_hedging.DEFAULT_PERCENTILE)
+    args = parser.parse_args()
+
+    stripe.api_key = "sk_test_benchmark"
+    print(f"\n=== {args.requests} checkout session creates, {args.concurrency} at a time ===")
+
+    plain = StandInStripe()
+    report("plain", run(plain, args.requests, args.concurrency), plain.attempts, args.requests)
+
+    stand_in = StandInStripe()
+    hedged = stripe_hedging.HedgingHTTPClient(stand_in, budget_ratio=args.budget, percentile=args.percentile)
+    report("hedged", run(hedged, args.requests, args.concurrency), stand_in.attempts, args.requests)
+    print(json.dumps(hedged.stats()))
+
+
+if __name__ == "__main__":
+    main()
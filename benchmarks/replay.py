@@ -0,0 +1,105 @@
+"""Profiles /pay and /webhook against a recorded HTTP cassette
+
+Usage:
+    # once, against the real Stripe/Twilio test accounts
+    HTTP_CASSETTE=bench.cassette.gz HTTP_CASSETTE_MODE=record python app.py
+    (click through a checkout so /pay and the webhook SMS get recorded)
+
+    python benchmarks/replay.py bench.cassette.gz [--requests 200] [--latency-scale 1.0]
+
+Every outbound Stripe and Twilio call is served from the cassette with its
+recorded latency times --latency-scale, so runs are repeatable without
+network access and numbers can be compared across commits. Webhooks are
+signed locally with a throwaway secret.
+"""
+import argparse
+import contextlib
+import hashlib
+import hmac
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+def signed_event(order_id, n):
+    payload = json.dumps({
+        "id": f"evt_bench_{n}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {"object": {
+            "id": f"cs_bench_{n}",
+            "object": "checkout.session",
+            "payment_intent": f"pi_bench_{n}",
+            "metadata": {"order_id": order_id},
+        }},
+    })
+    timestamp = int(time.time())
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode("utf-8"), f"{timestamp}.{payload}".encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    return payload, f"t={timestamp},v1={signature}"
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cassette")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    app = create_app({
+        "HTTP_CASSETTE": args.cassette,
+        "HTTP_CASSETTE_MODE": "replay",
+        "HTTP_CASSETTE_LATENCY_SCALE": args.latency_scale,
+        "STRIPE_API_KEY": "sk_test_benchmark",
+        "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "ORDER_DB_PATH": ":memory:",
+    })
+    client = app.test_client()
+
+    timings = {"/pay": [], "/webhook": []}
+    failures = 0
+    for n in range(args.requests):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            response = client.post("/pay")
+            timings["/pay"].append(time.perf_counter() - start)
+            failures += response.status_code != 200
+
+            payload, signature = signed_event(f"ORDbench{n:04d}", n)
+            start = time.perf_counter()
+            response = client.post("/webhook", data=payload, headers={"Stripe-Signature": signature})
+            timings["/webhook"].append(time.perf_counter() - start)
+            failures += response.status_code != 200
+
+    print(f"\n=== {args.requests} requests per route, latency scale {args.latency_scale} ===")
+    for route, samples in timings.items():
+        stats = percentiles(samples)
+        print(f"{route:9} " + "  ".join(f"{k} {v * 1e3:8.2f} ms" for k, v in stats.items()))
+    if failures:
+        print(f"❌ {failures} requests did not return 200")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measures cold-start cost of the payment service with python -X importtime
+
+Usage: python benchmarks/startup.py [--runs 5] [--top 15]
+
+Each run starts a fresh interpreter, imports app and calls create_app(),
+then reports the total import time and the heaviest top-level packages.
+stripe and twilio.rest are also timed on their own for comparison, since
+the app only imports them on first use.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPETS = {
+    "app + create_app()": "import app; app.create_app({'ORDER_DB_PATH': ':memory:'})",
+    "import stripe": "import stripe",
+    "import twilio.rest": "import twilio.rest",
+}
+
+
+def importtime(code):
+    """Runs code in a fresh interpreter and returns (total_us, {module: cumulative_us})
+
+    The breakdown covers modules imported directly by the top-level imports,
+    which is where lazy loading pays off.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    total = 0
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level under their parent
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        if depth == 0:
+            total += int(cumulative)
+        elif depth == 1:
+            modules[name.strip()] = modules.get(name.strip(), 0) + int(cumulative)
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    for label, code in SNIPPETS.items():
+        totals = []
+        last = {}
+        try:
+            for _ in range(args.runs):
+                total, last = importtime(code)
+                totals.append(total / 1000)
+        except RuntimeError as e:
+            print(f"❌ {label}: {e}")
+            continue
+
+        print(f"\n=== {label} ===")
+        print(f"median {statistics.median(totals):.1f} ms, min {min(totals):.1f} ms over {args.runs} runs")
+        for name, us in sorted(last.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
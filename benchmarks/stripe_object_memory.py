@@ -0,0 +1,136 @@
+"""Compares the memory held by a large Stripe payload as StripeObjects vs plain dicts
+
+Usage: python benchmarks/stripe_object_memory.py [--lines 1000]
+
+Builds an invoice with the given number of line items and measures with
+tracemalloc how much memory the parsed result keeps alive, in two shapes:
+
+- response: the invoice as an API call returns it, converted the way
+            stripe.Invoice.retrieve converts it
+- event:    an invoice.paid event, the shape Stripe sends to /webhook,
+            built with stripe.Webhook.construct_event's conversion
+
+each as a StripeObject tree from the stock stripe package, then with
+stripe_speedups' compact StripeObjects, against the plain dicts of
+json.loads, which is what the webhook now uses.
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+from stripe._util import convert_to_stripe_object
+
+import stripe_speedups
+
+
+def make_invoice(lines):
+    line_items = [
+        {
+            "id": f"il_{i:06d}",
+            "object": "line_item",
+            "amount": 5000,
+            "currency": "usd",
+            "description": "Premium Package",
+            "metadata": {"order_id": f"ORD{i:08x}"},
+            "period": {"start": 1700000000, "end": 1702592000},
+            "price": {
+                "id": "price_premium",
+                "object": "price",
+                "currency": "usd",
+                "unit_amount": 5000,
+                "product": "prod_premium",
+                "recurring": None,
+            },
+            "quantity": 1,
+            "tax_amounts": [],
+        }
+        for i in range(lines)
+    ]
+    return {
+        "id": "in_benchmark",
+        "object": "invoice",
+        "amount_paid": 5000 * lines,
+        "currency": "usd",
+        "lines": {
+            "object": "list",
+            "data": line_items,
+            "has_more": False,
+            "url": "/v1/invoices/in_benchmark/lines",
+        },
+        "metadata": {},
+    }
+
+
+def make_invoice_event(lines):
+    return {
+        "id": "evt_benchmark",
+        "object": "event",
+        "type": "invoice.paid",
+        "created": 1700000000,
+        "data": {"object": make_invoice(lines)},
+    }
+
+
+def count_objects(value):
+    if isinstance(value, dict):
+        return 1 + sum(count_objects(v) for v in value.values())
+    if isinstance(value, list):
+        return sum(count_objects(v) for v in value)
+    return 0
+
+
+def retained_bytes(build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def measure(payloads):
+    """Retained bytes of each payload as StripeObjects, keyed by shape"""
+    builds = {
+        "response": lambda: convert_to_stripe_object(json.loads(payloads["response"]), api_key="sk_test_benchmark"),
+        "event": lambda: stripe.Event._construct_from(
+            values=json.loads(payloads["event"]),
+            requestor=stripe._APIRequestor._global_instance(),
+            api_mode="V1",
+        ),
+    }
+    results = {}
+    for shape, build in builds.items():
+        build()  # warm up imports and caches so they are not counted
+        results[shape] = retained_bytes(build)[1]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=1000)
+    args = parser.parse_args()
+
+    payloads = {
+        "response": json.dumps(make_invoice(args.lines)),
+        "event": json.dumps(make_invoice_event(args.lines)),
+    }
+    stock = measure(payloads)
+    stripe_speedups.install()
+    compact = measure(payloads)
+
+    for shape, payload in payloads.items():
+        objects = count_objects(json.loads(payload))
+        _, dict_bytes = retained_bytes(lambda: json.loads(payload))
+        print(f"\n=== {shape}: invoice with {args.lines} line items ({objects} objects) ===")
+        for label, retained in (("stripe", stock[shape]), ("stripe_speedups", compact[shape]), ("plain dicts", dict_bytes)):
+            overhead = (retained - dict_bytes) / objects
+            print(f"{label:16} {retained / 1024:10.1f} KiB  {retained / objects:7.0f} B/object  "
+                  f"{overhead:7.0f} B/object over plain dicts")
+
+
+if __name__ == "__main__":
+    main()
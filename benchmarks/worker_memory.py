@@ -0,0 +1,113 @@
+"""Compares per-worker memory with and without the pre-fork warm-up
+
+Usage: python benchmarks/worker_memory.py [--workers 4] [--requests 200] [--cassette bench.cassette.gz]
+
+Starts gunicorn twice, with GUNICORN_WARMUP=0 and =1, sends the same
+requests to each, then reads every worker's unique RSS (memory only that
+worker holds, i.e. the cost of one more worker) and PSS from /proc. With
+--cassette (see benchmarks/replay.py) /pay is exercised as well, served
+from the recording with no delay. Linux only.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from warmup import memory_usage
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def hit(url, method="GET"):
+    data = b"" if method == "POST" else None
+    try:
+        urllib.request.urlopen(urllib.request.Request(url, data=data, method=method), timeout=10).read()
+    except urllib.error.HTTPError:
+        pass
+
+
+def wait_until_up(base, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            hit(base + "/success")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start within %ds" % timeout)
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def measure(warmup, args):
+    port = free_port()
+    env = dict(
+        os.environ,
+        GUNICORN_WARMUP="1" if warmup else "0",
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        WEB_CONCURRENCY=str(args.workers),
+        ORDER_DB_PATH=os.path.join(tempfile.gettempdir(), "benchmark-orders.db"),
+    )
+    if args.cassette:
+        env.update(HTTP_CASSETTE=args.cassette, HTTP_CASSETTE_MODE="replay", HTTP_CASSETTE_LATENCY_SCALE="0")
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_up(base)
+        for _ in range(args.requests):
+            hit(base + "/")
+            hit(base + "/success")
+            if args.cassette:
+                hit(base + "/pay", method="POST")
+        usage = [memory_usage(pid) for pid in worker_pids(server.pid)]
+        return [u for u in usage if u], memory_usage(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--cassette")
+    args = parser.parse_args()
+
+    if memory_usage() is None:
+        sys.exit("❌ /proc/<pid>/smaps_rollup is not available on this platform")
+
+    mb = lambda n: n / 2**20
+    print(f"\n=== {args.workers} workers, {args.requests} request rounds ===")
+    for warmup in (False, True):
+        workers, master = measure(warmup, args)
+        uss = statistics.fmean(u["uss"] for u in workers)
+        pss = statistics.fmean(u["pss"] for u in workers)
+        print(
+            f"warm-up {'on ' if warmup else 'off'}: per worker unique {mb(uss):6.1f} MB, "
+            f"PSS {mb(pss):6.1f} MB; master unique {mb(master['uss']):6.1f} MB; "
+            f"total PSS {mb(pss * len(workers) + master['pss']):6.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
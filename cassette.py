@@ -0,0 +1,213 @@
+"""Record/replay of Stripe and Twilio HTTP traffic for offline benchmarking
+
+In record mode, the real HTTP clients are wrapped and every exchange is
+appended to a gzip-compressed JSON lines file: service, method, URL, a hash
+of the request body, response status, headers and body, and the measured
+latency. Request headers are not written, so API keys and Twilio auth stay
+out of the file.
+
+In replay mode, the same clients serve responses from that file after
+sleeping for the recorded latency times latency_scale (0 for no delay).
+A request is matched on its exact body first. If nothing matches, the next
+recording for the same method and URL path is used, cycling, so that /pay
+(whose metadata carries a fresh order id each time) can be replayed any
+number of times.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import stripe
+from requests.structures import CaseInsensitiveDict
+
+
+def _body_hash(body):
+    if body is None:
+        return None
+    if isinstance(body, dict):
+        body = urlencode(sorted(body.items()))
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha1(body).hexdigest()
+
+
+def _encode_body(body):
+    """(text, encoding) for a response body: str as is, bytes as UTF-8 or base64"""
+    if isinstance(body, bytes):
+        try:
+            return body.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            return base64.b64encode(body).decode("ascii"), "base64"
+    return body, None
+
+
+def _decode_body(entry):
+    encoding = entry.get("body_encoding")
+    if encoding == "utf-8":
+        return entry["body"].encode("utf-8")
+    if encoding == "base64":
+        return base64.b64decode(entry["body"])
+    return entry["body"]
+
+
+class Cassette:
+    """A file of recorded exchanges, opened for recording or replay"""
+
+    def __init__(self, path, mode, latency_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError("Cassette mode must be 'record' or 'replay', not %r" % mode)
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._exact = {}
+        self._routes = {}
+        self._cursors = {}
+        self._stripe_client = None
+        self._twilio_client = None
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                exact = (entry["service"], entry["method"], entry["url"], entry["body_sha"])
+                route = (entry["service"], entry["method"], urlsplit(entry["url"]).path)
+                self._exact.setdefault(exact, []).append(entry)
+                self._routes.setdefault(route, []).append(entry)
+
+    def record(self, service, method, url, body, status, headers, response_body, latency):
+        """Appends one exchange; a failure is reported but never fails the live call"""
+        try:
+            text, encoding = _encode_body(response_body)
+            line = json.dumps({
+                "service": service,
+                "method": method.lower(),
+                "url": url,
+                "body_sha": _body_hash(body),
+                "status": status,
+                "headers": dict(headers or {}),
+                "body": text,
+                "body_encoding": encoding,
+                "latency": round(latency, 6),
+            }, separators=(",", ":"))
+            with self._lock:
+                # Each append is its own gzip member; readers see one stream
+                with gzip.open(self.path, "at", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            print(f"❌ Failed to record {service} {method.upper()} {url}: {str(e)}")
+
+    def replay(self, service, method, url, body):
+        """Returns the recorded entry for this request after its (scaled) latency"""
+        method = method.lower()
+        exact = (service, method, url, _body_hash(body))
+        route = (service, method, urlsplit(url).path)
+        with self._lock:
+            if exact in self._exact:
+                key, entries = exact, self._exact[exact]
+            elif route in self._routes:
+                key, entries = route, self._routes[route]
+            else:
+                raise LookupError("No recorded %s exchange for %s %s" % (service, method.upper(), url))
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            entry = entries[cursor % len(entries)]
+
+        if self.latency_scale:
+            time.sleep(entry["latency"] * self.latency_scale)
+        return entry
+
+    def stripe_client(self):
+        """HTTP client to install as stripe.default_http_client"""
+        if self._stripe_client is None:
+            if self.mode == "record":
+                self._stripe_client = RecordingStripeClient(self)
+            else:
+                self._stripe_client = ReplayStripeClient(self)
+        return self._stripe_client
+
+    def twilio_client(self):
+        """HTTP client to pass to twilio.rest.Client(http_client=...)"""
+        if self._twilio_client is None:
+            self._twilio_client = TwilioCassetteClient(self)
+        return self._twilio_client
+
+
+class RecordingStripeClient(stripe.HTTPClient):
+    name = "cassette-record"
+
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+        self.inner = stripe.new_default_http_client()
+
+    def request(self, method, url, headers, post_data=None):
+        start = time.monotonic()
+        body, status, response_headers = self.inner.request(method, url, headers, post_data)
+        self.cassette.record(
+            "stripe", method, url, post_data, status, response_headers, body, time.monotonic() - start
+        )
+        return body, status, response_headers
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayStripeClient(stripe.HTTPClient):
+    name = "cassette-replay"
+
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def request(self, method, url, headers, post_data=None):
+        entry = self.cassette.replay("stripe", method, url, post_data)
+        return _decode_body(entry), entry["status"], CaseInsensitiveDict(entry["headers"])
+
+    def close(self):
+        pass
+
+
+class TwilioCassetteClient:
+    """Implements twilio.http.HttpClient.request for both recording and replay"""
+
+    is_async = False
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+        self.inner = None
+        if cassette.mode == "record":
+            from twilio.http.http_client import TwilioHttpClient
+
+            self.inner = TwilioHttpClient()
+
+    def request(self, method, url, params=None, data=None, headers=None, auth=None,
+                timeout=None, allow_redirects=False):
+        from twilio.http.response import Response
+
+        if params:
+            url = url + "?" + urlencode(sorted(params.items()))
+
+        if self.inner is None:
+            entry = self.cassette.replay("twilio", method, url, data)
+            body = _decode_body(entry)
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            return Response(entry["status"], body, headers=CaseInsensitiveDict(entry["headers"]))
+
+        start = time.monotonic()
+        response = self.inner.request(
+            method, url, data=data, headers=headers, auth=auth,
+            timeout=timeout, allow_redirects=allow_redirects,
+        )
+        self.cassette.record(
+            "twilio", method, url, data, response.status_code, response.headers,
+            response.text, time.monotonic() - start,
+        )
+        return response
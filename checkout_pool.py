@@ -0,0 +1,112 @@
+"""Pool of pre-created Checkout Sessions, so /pay need not wait on Stripe
+
+Creating a session is a Stripe round trip on the customer's critical path.
+With a pool, a background thread creates sessions ahead of time, size per
+catalog item, each with its own order id recorded in the ledger as
+'pooled'. /pay claims one, which is a local SQLite update, and only creates
+a session itself when the pool is empty.
+
+Sessions are created to expire SESSION_SECONDS later. One is handed out
+only while it has at least min_remaining seconds left, so a customer always
+has time to pay, and is evicted from the pool (its order marked 'expired')
+after that; Stripe then lets it lapse.
+
+The pool lives in the ledger, so every gunicorn worker claims from the same
+sessions. Each worker runs a refill thread, started as the worker boots
+(gunicorn's post_fork hook) or else on its first request, but only the one
+holding an flock on <ledger>.pool.lock refills, so the workers do not all
+top the pool up at once. It checks every REFILL_SECONDS, and
+straight away after a claim made in its own worker.
+"""
+import os
+import threading
+import time
+import traceback
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-process dev server only
+    fcntl = None
+
+# Stripe's limit is 24 hours from creation; stay just under it
+SESSION_SECONDS = 24 * 3600 - 300
+DEFAULT_MIN_REMAINING = 3600
+REFILL_SECONDS = 10.0
+# Fewest seconds between refills after a failed one
+FAILURE_BACKOFF_SECONDS = 60.0
+
+
+class CheckoutPool:
+    def __init__(self, ledger, create_session, items, size, lock_path, min_remaining=DEFAULT_MIN_REMAINING):
+        """create_session(item, order_id, expires_at) creates one session and returns it"""
+        self.ledger = ledger
+        self.create_session = create_session
+        self.items = dict(items)  # item -> (amount, currency)
+        self.size = size
+        self.lock_path = lock_path
+        self.min_remaining = min_remaining
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {"claimed": 0, "empty": 0, "created": 0, "evicted": 0, "errors": 0}
+
+    def claim(self, item):
+        """Returns a ready session of item as {order_id, session_id, url}, or None"""
+        self.start()
+        session = self.ledger.claim_pooled_session(item, time.time() + self.min_remaining)
+        with self._lock:
+            self._stats["claimed" if session else "empty"] += 1
+        self._wake.set()
+        return session
+
+    def start(self):
+        """Starts this process's refill thread if it is not running yet"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="checkout-pool", daemon=True).start()
+
+    def _run(self):
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)  # wait for our turn
+            while True:
+                self._wake.clear()
+                try:
+                    self.refill()
+                except Exception:
+                    with self._lock:
+                        self._stats["errors"] += 1
+                    print("❌ Checkout pool refill failed")
+                    traceback.print_exc()
+                    time.sleep(FAILURE_BACKOFF_SECONDS)
+                self._wake.wait(REFILL_SECONDS)
+
+    def refill(self):
+        """Evicts sessions too close to expiry and tops every item up to size"""
+        now = time.time()
+        evicted = self.ledger.evict_pooled_sessions(now + self.min_remaining)
+        created = 0
+        for item, (amount, currency) in self.items.items():
+            missing = self.size - self.ledger.pooled_session_count(item, now + self.min_remaining)
+            for _ in range(max(0, missing)):
+                order_id = "ORD" + os.urandom(4).hex()
+                expires_at = int(time.time()) + SESSION_SECONDS
+                session = self.create_session(item, order_id, expires_at)
+                self.ledger.add_pooled_session(
+                    order_id, item, session.id, session.url, amount, currency, expires_at
+                )
+                created += 1
+        with self._lock:
+            self._stats["evicted"] += evicted
+            self._stats["created"] += created
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=self.size)
+        stats["ready"] = {
+            item: self.ledger.pooled_session_count(item, time.time() + self.min_remaining)
+            for item in self.items
+        }
+        return stats
@@ -0,0 +1,81 @@
+import os
+
+
+class Config:
+    """Settings read from the environment when the app is created"""
+
+    def __init__(self):
+        # Stripe
+        self.STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+        self.STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
+        self.STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+        # Larger webhook bodies are refused before they are read
+        self.WEBHOOK_MAX_BYTES = int(os.getenv("WEBHOOK_MAX_BYTES", 1024 * 1024))
+        # Swap in the faster helpers from stripe_speedups.py
+        self.STRIPE_SPEEDUPS = os.getenv("STRIPE_SPEEDUPS", "0") == "1"
+        # Share one response between concurrent identical GETs
+        self.STRIPE_SINGLEFLIGHT = os.getenv("STRIPE_SINGLEFLIGHT", "1") == "1"
+        # Re-send slow idempotent requests (see stripe_hedging.py)
+        self.STRIPE_HEDGING = os.getenv("STRIPE_HEDGING", "0") == "1"
+        self.STRIPE_HEDGE_BUDGET = float(os.getenv("STRIPE_HEDGE_BUDGET", "0.05"))
+        self.STRIPE_HEDGE_PERCENTILE = float(os.getenv("STRIPE_HEDGE_PERCENTILE", "0.95"))
+
+        # Retry policy shared by all calls to each dependency (see retry_policy.py)
+        self.STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+        self.TWILIO_MAX_RETRIES = int(os.getenv("TWILIO_MAX_RETRIES", "2"))
+        self.RETRY_BUDGET = float(os.getenv("RETRY_BUDGET", "0.1"))
+        self.RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", "20"))
+
+        # Time budget of a request and of each outbound call within it (see deadlines.py)
+        self.REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "25"))
+        self.STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "30"))
+        self.TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "15"))
+
+        # Checkout creations allowed at once per worker (see admission.py);
+        # keeps a couple of gunicorn threads free for webhooks
+        self.CHECKOUT_MAX_CONCURRENCY = int(
+            os.getenv("CHECKOUT_MAX_CONCURRENCY", max(1, int(os.getenv("GUNICORN_THREADS", "8")) - 2))
+        )
+
+        # Success pages waiting on /order/<id>/events at once per worker (see order_status.py)
+        self.ORDER_EVENTS_MAX_WAITERS = int(
+            os.getenv("ORDER_EVENTS_MAX_WAITERS", max(1, int(os.getenv("GUNICORN_THREADS", "8")) // 4))
+        )
+
+        # Pre-created checkout sessions per catalog item; 0 disables the pool (see checkout_pool.py)
+        self.CHECKOUT_POOL_SIZE = int(os.getenv("CHECKOUT_POOL_SIZE", "0"))
+        # Seconds a pooled session must have left before it expires to be handed out
+        self.CHECKOUT_POOL_MIN_REMAINING = int(os.getenv("CHECKOUT_POOL_MIN_REMAINING", 3600))
+
+        # Read-through cache of retrieved Stripe objects
+        self.STRIPE_CACHE_MAX_BYTES = int(os.getenv("STRIPE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.STRIPE_CACHE_TTL = int(os.getenv("STRIPE_CACHE_TTL", 300))
+
+        # Twilio
+        self.TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+        self.TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+        self.TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+        self.CUSTOMER_PHONE_NUMBER = os.getenv("CUSTOMER_PHONE_NUMBER")
+
+        # Record or replay outbound HTTP (see cassette.py)
+        self.HTTP_CASSETTE = os.getenv("HTTP_CASSETTE")
+        self.HTTP_CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "replay")
+        self.HTTP_CASSETTE_LATENCY_SCALE = float(os.getenv("HTTP_CASSETTE_LATENCY_SCALE", "1.0"))
+
+        # Archive of raw webhook events (see event_archive.py)
+        self.EVENT_ARCHIVE_DIR = os.getenv("EVENT_ARCHIVE_DIR", "events")
+        self.EVENT_ARCHIVE_SEGMENT_BYTES = int(os.getenv("EVENT_ARCHIVE_SEGMENT_BYTES", 64 * 1024 * 1024))
+        # Events hold customer details; segments older than this are deleted (0 keeps them all)
+        self.EVENT_ARCHIVE_RETENTION_DAYS = int(os.getenv("EVENT_ARCHIVE_RETENTION_DAYS", 90))
+
+        # Local order ledger
+        self.ORDER_DB_PATH = os.getenv("ORDER_DB_PATH", "orders.db")
+        # Column files for /analytics, rebuilt when older than ANALYTICS_MAX_AGE seconds
+        self.ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+        self.ANALYTICS_MAX_AGE = int(os.getenv("ANALYTICS_MAX_AGE", 300))
+        # /export and /analytics are refused unless requests carry "Authorization: Bearer <EXPORT_TOKEN>"
+        self.EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+        # Longest period one /export request may cover
+        self.EXPORT_MAX_DAYS = int(os.getenv("EXPORT_MAX_DAYS", 366))
+        # Rolling totals served by /stats (see aggregates.py)
+        self.AGGREGATES_PATH = os.getenv("AGGREGATES_PATH", "aggregates.bin")
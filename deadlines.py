@@ -0,0 +1,91 @@
+"""Per-request deadlines that every outbound call honours
+
+A request gets a deadline when it starts: the route's @deadline(seconds),
+or REQUEST_DEADLINE for routes without one. A caller can ask for less (never
+more) with an X-Request-Timeout header, in seconds. The deadline is held in
+a context variable, so everything the request calls can read it:
+
+- HTTP clients use call_timeout(default) as their socket timeout: their
+  usual timeout, capped by what is left of the request
+- waits on other threads' work (coalesced Stripe reads) give up when the
+  deadline passes
+- retries are not started if they would end past it
+
+Once nothing is left, call_timeout() raises DeadlineExceeded instead of
+starting another call. Work handed to a thread pool must be submitted with
+contextvars.copy_context().run to carry the deadline along.
+"""
+import contextvars
+import time
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+_expires_at = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def deadline(seconds):
+    """View decorator setting the route's deadline"""
+    def decorate(view):
+        view.deadline = seconds
+        return view
+    return decorate
+
+
+def start(seconds):
+    """Sets the current deadline to seconds from now; returns a token for reset()"""
+    return _expires_at.set(time.monotonic() + seconds)
+
+
+def reset(token):
+    _expires_at.reset(token)
+
+
+def expires_at():
+    """Monotonic time of the current deadline, or None outside a request"""
+    return _expires_at.get()
+
+
+def remaining():
+    """Seconds left (may be negative), or None when there is no deadline"""
+    expires = _expires_at.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def call_timeout(default=None):
+    """Timeout for the next blocking step: default, capped by the time left
+
+    Raises DeadlineExceeded when the deadline has already passed.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if default is None else min(default, left)
+
+
+class DeadlineTwilioClient:
+    """Wraps a twilio HttpClient so each request's timeout respects the deadline"""
+
+    is_async = False
+
+    def __init__(self, inner, default_timeout):
+        self.inner = inner
+        self.default_timeout = default_timeout
+
+    def request(self, method, url, params=None, data=None, headers=None, auth=None,
+                timeout=None, allow_redirects=False):
+        return self.inner.request(
+            method, url, params=params, data=data, headers=headers, auth=auth,
+            timeout=call_timeout(timeout or self.default_timeout),
+            allow_redirects=allow_redirects,
+        )
@@ -0,0 +1,331 @@
+"""Append-only archive of verified webhook events
+
+Events are written, as received, to segment files in the archive directory.
+Each process has its own segment, named <opened ns>-<pid>-<n>, so gunicorn
+workers never share a file. A segment is a series of blocks:
+
+    BLOCK_MAGIC, compressed length, raw length, zlib(payload + payload + ...)
+
+Payloads are gathered in memory and compressed together once BLOCK_BYTES
+have built up or the oldest is FLUSH_SECONDS old, so the archive is
+compressed across events rather than event by event. At SEGMENT_BYTES the
+segment is sealed and a new one opened.
+
+Next to every segment, <name>.idx holds one fixed-size RECORD per event
+(62 bytes): created time, block offset and length, position and length
+inside the block, a type code and the event id. Type codes are line numbers
+in <name>.types. An index record is only written after its block and type,
+so readers never see an event whose data is incomplete. When a segment is
+sealed, <name>.ids is written: the segment's created range, then (event id,
+record number) pairs sorted by id. Lookups work from the index alone:
+
+- get(event_id) binary-searches each sealed segment's .ids and scans the
+  .idx of the ones still open
+- iter_range(start, end) skips sealed segments whose created range does not
+  overlap, walks the .idx of the rest through mmap and decompresses only the
+  blocks that hold a match, each once
+
+A timer armed with the first buffered event writes the block once it is
+FLUSH_SECONDS old, even if no other event arrives, and buffered events are
+flushed at exit; a hard crash loses at most FLUSH_SECONDS of them.
+
+Events carry customer details (email, name, address, phone), so the
+directory is created mode 0700 and every file in it 0600. Segments whose
+newest event is older than retention_days are deleted whenever a segment is
+sealed, or by prune(); retention_days=0 keeps everything.
+"""
+import atexit
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+BLOCK_MAGIC = b"EVB1"
+BLOCK_HEADER = struct.Struct("<4sII")
+# created, block offset, block length, offset in block, length, type code, event id
+RECORD = struct.Struct("<qQIIIH32s")
+# min created, max created, records
+IDS_HEADER = struct.Struct("<qqQ")
+# event id, record number in .idx
+IDS_ENTRY = struct.Struct("<32sI")
+MAX_ID_LENGTH = 32
+
+BLOCK_BYTES = 256 * 1024
+FLUSH_SECONDS = 2.0
+SEGMENT_BYTES = 64 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+RETENTION_DAYS = 90
+SEGMENT_SUFFIXES = (".idx", ".ids", ".types", ".seg")
+
+
+_segment_numbers = itertools.count()
+
+
+def _text(field):
+    return field.rstrip(b"\0").decode("ascii")
+
+
+def _key(event_id):
+    return event_id.encode("ascii").ljust(MAX_ID_LENGTH, b"\0")
+
+
+def _private(path, flags):
+    """open() opener that creates files readable by their owner only"""
+    return os.open(path, flags, 0o600)
+
+
+class EventArchive:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, block_bytes=BLOCK_BYTES,
+                 flush_seconds=FLUSH_SECONDS, retention_days=RETENTION_DAYS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.block_bytes = block_bytes
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segment = None  # opened on first append, after any fork
+        self._pending = []  # (event_id, event_type, created, payload)
+        self._pending_bytes = 0
+        self._pending_since = None
+        atexit.register(self.close)
+
+    def append(self, event_id, event_type, created, payload):
+        """Queues one verified event; payload is the raw body as received"""
+        if len(event_id) > MAX_ID_LENGTH:
+            raise ValueError("Event id too long to index: %s" % event_id)
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+                timer = threading.Timer(self.flush_seconds, self._flush_due)
+                timer.daemon = True
+                timer.start()
+            self._pending.append((event_id, event_type, int(created), bytes(payload)))
+            self._pending_bytes += len(payload)
+            if (self._pending_bytes >= self.block_bytes
+                    or time.monotonic() - self._pending_since >= self.flush_seconds):
+                self._write_block()
+
+    def flush(self):
+        with self._lock:
+            self._write_block()
+
+    def _flush_due(self):
+        with self._lock:
+            if self._pending and time.monotonic() - self._pending_since >= self.flush_seconds:
+                self._write_block()
+
+    def close(self):
+        """Flushes and seals the current segment"""
+        with self._lock:
+            self._write_block()
+            if self._segment is not None:
+                self._seal()
+
+    def _open_segment(self):
+        # Unique even when a segment rotates within the clock's resolution;
+        # "xb" fails rather than append to another segment's files
+        while True:
+            name = "%019d-%d-%d" % (time.time_ns(), os.getpid(), next(_segment_numbers))
+            path = os.path.join(self.directory, name)
+            try:
+                data = open(path + ".seg", "xb", opener=_private)
+                break
+            except FileExistsError:
+                continue
+        self._segment = {
+            "path": path,
+            "data": data,
+            "index": open(path + ".idx", "ab", opener=_private),
+            "types": open(path + ".types", "a", encoding="utf-8", opener=_private),
+            "type_codes": {},
+        }
+
+    def _write_block(self):
+        if not self._pending:
+            return
+        if self._segment is None:
+            self._open_segment()
+
+        raw = b"".join(payload for _, _, _, payload in self._pending)
+        compressed = zlib.compress(raw, COMPRESSION_LEVEL)
+        data = self._segment["data"]
+        offset = data.tell()
+        data.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(compressed), len(raw)))
+        data.write(compressed)
+        data.flush()
+
+        type_codes = self._segment["type_codes"]
+        for _, event_type, _, _ in self._pending:
+            if event_type not in type_codes:
+                type_codes[event_type] = len(type_codes)
+                self._segment["types"].write(event_type + "\n")
+        self._segment["types"].flush()
+
+        records = []
+        position = 0
+        block_length = BLOCK_HEADER.size + len(compressed)
+        for event_id, event_type, created, payload in self._pending:
+            records.append(RECORD.pack(
+                created, offset, block_length, position, len(payload),
+                type_codes[event_type], _key(event_id),
+            ))
+            position += len(payload)
+        index = self._segment["index"]
+        index.write(b"".join(records))
+        index.flush()
+
+        self._pending = []
+        self._pending_bytes = 0
+        if data.tell() >= self.segment_bytes:
+            self._seal()
+
+    def _seal(self):
+        segment, self._segment = self._segment, None
+        segment["data"].close()
+        segment["index"].close()
+        segment["types"].close()
+        records = self._records(segment["path"] + ".idx")
+        if records:
+            created = [record[0] for record in records]
+            entries = sorted((record[6], number) for number, record in enumerate(records))
+            tmp = segment["path"] + ".ids.tmp"
+            with open(tmp, "wb", opener=_private) as f:
+                f.write(IDS_HEADER.pack(min(created), max(created), len(entries)))
+                f.write(b"".join(IDS_ENTRY.pack(*entry) for entry in entries))
+            os.replace(tmp, segment["path"] + ".ids")
+
+        if self.retention_days:
+            try:
+                self.prune(time.time() - self.retention_days * 86400)
+            except OSError as e:
+                print(f"❌ Failed to prune event archive: {e}")
+
+    def prune(self, before):
+        """Deletes segments holding only events created before before; returns how many
+
+        A segment that was never sealed (its worker was killed) has no
+        created range, so it goes once its index was last written before
+        before. The segment this archive is writing is never deleted.
+        """
+        current = self._segment["path"] if self._segment is not None else None
+        pruned = 0
+        for path in self._segments():
+            if path == current:
+                continue
+            try:
+                if os.path.exists(path + ".ids"):
+                    with open(path + ".ids", "rb") as f:
+                        newest = IDS_HEADER.unpack(f.read(IDS_HEADER.size))[1]
+                else:
+                    newest = os.path.getmtime(path + ".idx")
+            except FileNotFoundError:
+                continue  # pruned by another worker
+            if newest >= before:
+                continue
+            # .idx first, so readers stop listing the segment before its data goes
+            for suffix in SEGMENT_SUFFIXES:
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+            pruned += 1
+        return pruned
+
+    # Reading
+
+    def _segments(self):
+        names = sorted({name.rsplit(".", 1)[0] for name in os.listdir(self.directory) if name.endswith(".idx")})
+        return [os.path.join(self.directory, name) for name in names]
+
+    def get(self, event_id):
+        """Returns the raw payload of event_id, or None"""
+        key = _key(event_id)
+        for path in self._segments():
+            try:
+                if os.path.exists(path + ".ids"):
+                    record = self._search_sorted(path, key)
+                else:
+                    record = next(
+                        (r for r in self._records(path + ".idx") if r[6] == key), None
+                    )
+                if record is not None:
+                    return next(self._payloads(path + ".seg", [record]))[1]
+            except FileNotFoundError:
+                continue  # pruned since it was listed
+        return None
+
+    def iter_range(self, start, end, event_type=None):
+        """Yields (event_id, type, created, payload) for events created in [start, end)
+
+        Events come in the order they were archived, segment by segment.
+        """
+        for path in self._segments():
+            try:
+                if os.path.exists(path + ".ids"):
+                    with open(path + ".ids", "rb") as f:
+                        low, high, _ = IDS_HEADER.unpack(f.read(IDS_HEADER.size))
+                    if high < start or low >= end:
+                        continue
+                types = self._types(path)
+                matches = [
+                    r for r in self._records(path + ".idx")
+                    if start <= r[0] < end and (event_type is None or types[r[5]] == event_type)
+                ]
+            except FileNotFoundError:
+                continue  # pruned since it was listed
+            for record, payload in self._payloads(path + ".seg", matches):
+                yield _text(record[6]), types[record[5]], record[0], payload
+
+    def _records(self, path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            size -= size % RECORD.size  # ignore a record still being written
+            if not size:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+                return list(RECORD.iter_unpack(view[:size]))
+
+    def _types(self, path):
+        with open(path + ".types", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def _search_sorted(self, path, key):
+        """Finds key in a sealed segment's .ids; returns its .idx record or None"""
+        with open(path + ".ids", "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            low, high = 0, IDS_HEADER.unpack_from(m)[2]
+            while low < high:
+                mid = (low + high) // 2
+                at = IDS_HEADER.size + mid * IDS_ENTRY.size
+                found = m[at:at + MAX_ID_LENGTH]
+                if found < key:
+                    low = mid + 1
+                elif found > key:
+                    high = mid
+                else:
+                    number = IDS_ENTRY.unpack_from(m, at)[1]
+                    break
+            else:
+                return None
+        with open(path + ".idx", "rb") as f:
+            f.seek(number * RECORD.size)
+            return RECORD.unpack(f.read(RECORD.size))
+
+    def _payloads(self, path, records):
+        """Yields (record, payload) for records in block order, decompressing each block once"""
+        block_offset = raw = None
+        with open(path, "rb") as f:
+            for record in records:
+                created, offset, length, position, size = record[:5]
+                if offset != block_offset:
+                    f.seek(offset)
+                    block = f.read(length)
+                    magic, _, raw_length = BLOCK_HEADER.unpack_from(block)
+                    if magic != BLOCK_MAGIC:
+                        raise ValueError("Corrupt block at %s:%d" % (path, offset))
+                    raw = zlib.decompress(block[BLOCK_HEADER.size:], bufsize=raw_length)
+                    block_offset = offset
+                yield record, raw[position:position + size]
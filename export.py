@@ -0,0 +1,94 @@
+"""Streaming CSV and NDJSON exports of orders and payments
+
+Every stage is a generator, so an export is produced while it is sent and
+memory stays flat however many rows it has:
+
+    rows(source)   -> dicts, from the ledger cursor in batches or from
+                      Stripe's list pagination one page at a time
+    encode(format) -> bytes, gathered into CHUNK_BYTES pieces
+    gzipped()      -> optional compression of those pieces on the fly
+
+A Flask route returns the result as a streamed response; the CLI writes it
+to a file.
+"""
+import csv
+import io
+import json
+import zlib
+
+CHUNK_BYTES = 64 * 1024
+STRIPE_PAGE_SIZE = 100
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+FIELDS = {
+    "orders": ["order_id", "session_id", "payment_intent_id", "amount", "currency", "status", "created"],
+    "checkout_sessions": [
+        "id", "created", "status", "payment_status", "amount_total", "currency", "payment_intent", "order_id",
+    ],
+    "payment_intents": ["id", "created", "status", "amount", "amount_received", "currency", "order_id"],
+}
+SOURCES = tuple(FIELDS)
+
+
+def _stripe_rows(resource, start, end, fields):
+    params = {"created": {"gte": int(start), "lt": int(end)}, "limit": STRIPE_PAGE_SIZE}
+    for obj in resource.list(**params).auto_paging_iter():
+        row = {field: obj.get(field) for field in fields}
+        row["order_id"] = (obj.get("metadata") or {}).get("order_id")
+        yield row
+
+
+def rows(source, start, end, ledger=None):
+    """Yields the source's rows created in [start, end) as dicts of FIELDS[source]"""
+    if source == "orders":
+        return ledger.iter_orders(start, end)
+
+    import stripe
+
+    if source == "checkout_sessions":
+        return _stripe_rows(stripe.checkout.Session, start, end, FIELDS[source])
+    if source == "payment_intents":
+        return _stripe_rows(stripe.PaymentIntent, start, end, FIELDS[source])
+    raise ValueError("Unknown export source: %s" % source)
+
+
+def encode(rows, format, fields):
+    """Yields rows encoded as CSV (with a header) or NDJSON, CHUNK_BYTES at a time"""
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.DictWriter(buffer, fields, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        write = writer.writerow
+    elif format == "ndjson":
+        def write(row):
+            buffer.write(json.dumps({field: row.get(field) for field in fields}))
+            buffer.write("\n")
+    else:
+        raise ValueError("Unknown export format: %s" % format)
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzipped(chunks, level=6):
+    """Compresses a stream of chunks into one gzip file, piece by piece"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(source, format, start, end, ledger=None, compress=False):
+    """Yields the bytes of an export of source in format"""
+    if format not in FORMATS:
+        raise ValueError("Unknown export format: %s" % format)
+    chunks = encode(rows(source, start, end, ledger), format, FIELDS[source])
+    return gzipped(chunks) if compress else chunks
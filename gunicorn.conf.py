@@ -0,0 +1,63 @@
+"""Gunicorn settings for running wsgi:app in production
+
+Sizing: every request spends nearly all of its time waiting on Stripe or
+Twilio (a checkout session create is a few hundred milliseconds of network
+time against a millisecond or two of Python), so a worker is idle on I/O far
+more than it is busy on the CPU. We run one process per core plus one, to
+keep every core busy across the GIL, and give each process a pool of
+threads to cover the network wait. Rough capacity is
+
+    workers * threads / average outbound latency (s)  requests per second
+
+e.g. 5 workers * 8 threads / 0.4s = 100 checkouts/s on a 4 core node. Tune
+GUNICORN_THREADS up if CPU stays low while requests queue, and
+WEB_CONCURRENCY down if memory is the limit. Every value can be overridden
+from the environment without editing this file.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "5000"))
+
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Stripe's own client timeout is 80s; fail the request long before that
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to cap slow leaks
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
+
+# Load and warm up the app once in the master so workers share it
+# copy-on-write (see warmup.py); GUNICORN_WARMUP=0 loads it in every worker
+preload_app = os.getenv("GUNICORN_WARMUP", "1") == "1"
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        import warmup
+        warmup.prefork(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    # Without preload the app is loaded later, and starts them on its first request
+    if preload_app:
+        import warmup
+        warmup.postfork(server.app.wsgi())
+
+
+def worker_exit(server, worker):
+    import warmup
+    usage = warmup.memory_usage()
+    if usage:
+        server.log.info(
+            "Worker %s exiting: unique RSS %.1f MB, PSS %.1f MB",
+            worker.pid, usage["uss"] / 2**20, usage["pss"] / 2**20,
+        )
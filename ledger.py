@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = "orders.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    session_id TEXT,
+    payment_intent_id TEXT,
+    amount INTEGER,
+    currency TEXT,
+    status TEXT NOT NULL DEFAULT 'created',
+    created INTEGER NOT NULL,
+    claimed_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS orders_created ON orders (created);
+CREATE INDEX IF NOT EXISTS orders_session ON orders (session_id);
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL,
+    event_id TEXT,
+    success INTEGER NOT NULL,
+    result TEXT,
+    created INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notifications_order ON notifications (order_id);
+CREATE TABLE IF NOT EXISTS session_pool (
+    order_id TEXT PRIMARY KEY,
+    item TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    expires_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_pool_item ON session_pool (item, expires_at);
+"""
+
+# Columns added to tables after databases were already in use
+MIGRATIONS = (
+    ("orders", "claimed_at", "INTEGER"),
+)
+
+
+class OrderLedger:
+    """Local record of the orders we create and the SMS confirmations we send"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("ORDER_DB_PATH", DEFAULT_DB_PATH)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self):
+        conn = self._conn()
+        for table, column, definition in MIGRATIONS:
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(%s)" % table)}
+            if column in columns:
+                continue
+            try:
+                with conn:
+                    conn.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, column, definition))
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # another worker added it first
+                    raise
+
+    def close(self):
+        """Closes this thread's connection; the next call opens a new one"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def record_order(self, order_id, session_id, amount, currency, created=None):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO orders "
+                "(order_id, session_id, amount, currency, status, created) "
+                "VALUES (?, ?, ?, ?, 'created', ?)",
+                (order_id, session_id, amount, currency, int(created or time.time())),
+            )
+
+    def mark_paid(self, order_id, payment_intent_id=None):
+        """Returns True if this call moved the order to paid
+
+        Stripe sends more than one event per payment and may redeliver any
+        of them, so callers count a payment only when this returns True.
+        """
+        conn = self._conn()
+        with conn:
+            newly_paid = conn.execute(
+                "UPDATE orders SET status = 'paid' WHERE order_id = ? AND status != 'paid'",
+                (order_id,),
+            ).rowcount > 0
+            conn.execute(
+                "UPDATE orders SET payment_intent_id = COALESCE(?, payment_intent_id) WHERE order_id = ?",
+                (payment_intent_id, order_id),
+            )
+        return newly_paid
+
+    # Pre-created checkout sessions (see checkout_pool.py)
+
+    def add_pooled_session(self, order_id, item, session_id, url, amount, currency, expires_at):
+        """Records a pre-created session and its order, which stays 'pooled' until claimed"""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO orders "
+                "(order_id, session_id, amount, currency, status, created) "
+                "VALUES (?, ?, ?, ?, 'pooled', ?)",
+                (order_id, session_id, amount, currency, int(time.time())),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO session_pool (order_id, item, session_id, url, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (order_id, item, session_id, url, int(expires_at)),
+            )
+
+    def claim_pooled_session(self, item, expires_after):
+        """Takes the pooled session of item that expires first, but after expires_after
+
+        Returns it as a dict, its order now 'created', or None if there is none.
+        The order keeps the created time of its Checkout Session, which is what
+        Stripe reports and reconcile matches on; the claim is in claimed_at.
+        Safe across processes: a session another worker took first is skipped.
+        """
+        conn = self._conn()
+        while True:
+            row = conn.execute(
+                "SELECT * FROM session_pool WHERE item = ? AND expires_at > ? ORDER BY expires_at LIMIT 1",
+                (item, int(expires_after)),
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                taken = conn.execute(
+                    "DELETE FROM session_pool WHERE order_id = ?", (row["order_id"],)
+                ).rowcount
+                if taken:
+                    conn.execute(
+                        "UPDATE orders SET status = 'created', claimed_at = ? WHERE order_id = ?",
+                        (int(time.time()), row["order_id"]),
+                    )
+                    return dict(row)
+
+    def pooled_session_count(self, item, expires_after):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM session_pool WHERE item = ? AND expires_at > ?",
+            (item, int(expires_after)),
+        ).fetchone()[0]
+
+    def evict_pooled_sessions(self, expires_before):
+        """Drops pooled sessions expiring before expires_before; their orders become 'expired'"""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE orders SET status = 'expired' WHERE order_id IN "
+                "(SELECT order_id FROM session_pool WHERE expires_at <= ?)",
+                (int(expires_before),),
+            )
+            return conn.execute(
+                "DELETE FROM session_pool WHERE expires_at <= ?", (int(expires_before),)
+            ).rowcount
+
+    def record_notification(self, order_id, event_id, success, result):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO notifications (order_id, event_id, success, result, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (order_id, event_id, int(bool(success)), result, int(time.time())),
+            )
+
+    def get_order(self, order_id):
+        row = self._conn().execute(
+            "SELECT * FROM orders WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_order_by_session(self, session_id):
+        row = self._conn().execute(
+            "SELECT * FROM orders WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def iter_orders(self, start, end, batch_size=1000):
+        """Yields orders created in [start, end) without loading them all at once"""
+        cursor = self._conn().execute(
+            "SELECT * FROM orders WHERE created >= ? AND created < ? ORDER BY created",
+            (int(start), int(end)),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+    def confirmed_order_ids(self, order_ids):
+        """Returns the subset of order_ids that have at least one successful SMS"""
+        confirmed = set()
+        order_ids = list(order_ids)
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(order_ids), 500):
+            chunk = order_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn().execute(
+                "SELECT DISTINCT order_id FROM notifications "
+                f"WHERE success = 1 AND order_id IN ({placeholders})",
+                chunk,
+            )
+            confirmed.update(row["order_id"] for row in rows)
+        return confirmed
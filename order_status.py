@@ -0,0 +1,88 @@
+"""Order status for the success page, without asking Stripe
+
+The webhook publishes each order it marks paid to an OrderStatusBoard.
+Status requests look there first and then in the local ledger, so however
+often a browser asks, nothing goes out to Stripe. "paid" is the only
+status the board holds: it never changes again, so a cached copy cannot go
+stale, while anything earlier is read fresh from the ledger.
+
+Browsers waiting for payment follow stream(), a server-sent event stream.
+publish() wakes the waiters in this worker at once; if the webhook lands in
+another gunicorn worker, waiters see it in the ledger on their next check,
+within POLL_SECONDS. Each waiter holds a thread, so only max_waiters of them
+wait at a time per worker. Over that, a stream sends the current status
+once and ends, and the browser's EventSource reconnects after RETRY_MS.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+POLL_SECONDS = 1.0
+STREAM_SECONDS = 25
+RETRY_MS = 2000
+FINAL_STATUSES = ("paid",)
+PUBLIC_FIELDS = ("order_id", "status", "amount", "currency", "created")
+
+
+def public(order):
+    """The fields of a ledger order a browser may see"""
+    return {field: order.get(field) for field in PUBLIC_FIELDS}
+
+
+class OrderStatusBoard:
+    def __init__(self, max_orders=10000, max_waiters=2):
+        self.max_orders = max_orders
+        self._orders = OrderedDict()  # order_id or session_id -> order
+        self._changed = threading.Condition()
+        self._waiters = threading.BoundedSemaphore(max_waiters)
+
+    def publish(self, order):
+        """Records an order that reached a final status and wakes waiting streams"""
+        if order is None or order["status"] not in FINAL_STATUSES:
+            return
+        with self._changed:
+            for key in (order["order_id"], order.get("session_id")):
+                if key:
+                    self._orders[key] = order
+                    self._orders.move_to_end(key)
+            while len(self._orders) > self.max_orders:
+                self._orders.popitem(last=False)
+            self._changed.notify_all()
+
+    def lookup(self, ledger, key):
+        """The order with this order id or Checkout Session id, or None"""
+        with self._changed:
+            order = self._orders.get(key)
+        if order is not None:
+            return order
+        if key.startswith("cs_"):
+            return ledger.get_order_by_session(key)
+        return ledger.get_order(key)
+
+    def stream(self, ledger, key, seconds=STREAM_SECONDS):
+        """Yields SSE messages with the order's status whenever it changes
+
+        Ends once the status is final, after seconds, or straight after the
+        first message if too many streams are already waiting.
+        """
+        yield "retry: %d\n\n" % RETRY_MS
+        waiting = self._waiters.acquire(blocking=False)
+        try:
+            until = time.monotonic() + seconds
+            last = ()  # no status sent yet; None means not found
+            while True:
+                order = self.lookup(ledger, key)
+                status = order["status"] if order else None
+                if status != last:
+                    data = public(order) if order else {"error": "Order not found"}
+                    yield "event: status\ndata: %s\n\n" % json.dumps(data)
+                    last = status
+                left = until - time.monotonic()
+                if not waiting or order is None or status in FINAL_STATUSES or left <= 0:
+                    return
+                with self._changed:
+                    self._changed.wait(min(POLL_SECONDS, left))
+        finally:
+            if waiting:
+                self._waiters.release()
@@ -0,0 +1,147 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WINDOW_SECONDS = 3600
+STRIPE_PAGE_SIZE = 100
+
+
+def split_windows(start, end, step):
+    """Splits [start, end) into consecutive [lo, hi) windows of at most step seconds"""
+    lo = int(start)
+    while lo < end:
+        hi = min(lo + step, int(end))
+        yield lo, hi
+        lo = hi
+
+
+def stream_paid_objects(start, end):
+    """Yields (source, stripe_id, order_id) for every paid session and succeeded intent in the window"""
+    import stripe
+
+    params = {"created": {"gte": start, "lt": end}, "limit": STRIPE_PAGE_SIZE}
+
+    for session in stripe.checkout.Session.list(**params).auto_paging_iter():
+        if session.get("payment_status") == "paid":
+            order_id = (session.get("metadata") or {}).get("order_id")
+            yield "checkout.session", session["id"], order_id
+
+    for intent in stripe.PaymentIntent.list(**params).auto_paging_iter():
+        if intent.get("status") == "succeeded":
+            order_id = (intent.get("metadata") or {}).get("order_id")
+            yield "payment_intent", intent["id"], order_id
+
+
+def paid_in_stripe(orders, cache=None):
+    """The ids of orders whose own session is paid, or payment intent succeeded, in Stripe
+
+    An order and its session are created moments apart, so they can fall
+    into neighbouring windows; this looks them up by id instead. A
+    StripeLoader fetches each session with its payment intent expanded, one
+    request per order, all of them concurrently, and through the
+    StripeObjectCache when one is given.
+    """
+    import stripe
+    from stripe_loader import StripeLoader
+
+    loader = StripeLoader(cache)
+    checks = []  # (order_id, session handle or None, payment intent handle)
+    for order in orders:
+        if order.get("session_id"):
+            session = loader.load(stripe.checkout.Session, order["session_id"])
+            checks.append((order["order_id"], session, loader.load_field(session, "payment_intent")))
+        elif order.get("payment_intent_id"):
+            checks.append((order["order_id"], None, loader.load(stripe.PaymentIntent, order["payment_intent_id"])))
+
+    paid = set()
+    for order_id, session, intent in checks:
+        if session is not None and session.get().get("payment_status") == "paid":
+            paid.add(order_id)
+        elif intent.get() and intent.get().get("status") == "succeeded":
+            paid.add(order_id)
+    return paid
+
+
+def reconcile_window(ledger, start, end, cache=None):
+    """Joins one window of Stripe objects against the ledger and returns the mismatches
+
+    Only this window's orders are held in memory, so the window size bounds
+    the footprint regardless of how far back the whole run goes.
+    """
+    local = {order["order_id"]: order for order in ledger.iter_orders(start, end)}
+    paid = {}
+    mismatches = []
+
+    for source, stripe_id, order_id in stream_paid_objects(start, end):
+        if not order_id:
+            mismatches.append({
+                "type": "missing_order_id",
+                "source": source,
+                "stripe_id": stripe_id,
+                "order_id": None,
+            })
+            continue
+
+        # Sessions can be created a moment after their order, across a window edge
+        if order_id not in local:
+            order = ledger.get_order(order_id)
+            if order is None:
+                mismatches.append({
+                    "type": "unknown_order",
+                    "source": source,
+                    "stripe_id": stripe_id,
+                    "order_id": order_id,
+                })
+                continue
+            local[order_id] = order
+
+        paid.setdefault(order_id, (source, stripe_id))
+
+    confirmed = ledger.confirmed_order_ids(paid)
+    for order_id, (source, stripe_id) in paid.items():
+        if order_id not in confirmed:
+            mismatches.append({
+                "type": "missing_confirmation",
+                "source": source,
+                "stripe_id": stripe_id,
+                "order_id": order_id,
+            })
+
+    unmatched = [order for order_id, order in local.items() if order["status"] == "paid" and order_id not in paid]
+    paid_elsewhere = paid_in_stripe(unmatched, cache) if unmatched else set()
+    for order in unmatched:
+        if order["order_id"] not in paid_elsewhere:
+            mismatches.append({
+                "type": "not_paid_in_stripe",
+                "source": "ledger",
+                "stripe_id": order["session_id"],
+                "order_id": order["order_id"],
+            })
+
+    return mismatches
+
+
+def reconcile(ledger, start, end=None, window_seconds=DEFAULT_WINDOW_SECONDS, max_workers=4, cache=None):
+    """Reconciles [start, end) window by window, fetching up to max_workers windows in parallel
+
+    Yields mismatches as each batch of windows completes. At most
+    max_workers windows are in flight at once, which keeps memory bounded
+    for arbitrarily long ranges. A checkout's session and payment intent
+    are often created in different windows, so each kind of mismatch is
+    reported once per order over the whole run.
+    """
+    end = int(end or time.time())
+    windows = list(split_windows(start, end, window_seconds))
+    reported = set()  # (type, order_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i in range(0, len(windows), max_workers):
+            batch = windows[i:i + max_workers]
+            futures = [executor.submit(reconcile_window, ledger, lo, hi, cache) for lo, hi in batch]
+            for future in futures:
+                for mismatch in future.result():
+                    if mismatch["order_id"] is not None:
+                        key = (mismatch["type"], mismatch["order_id"])
+                        if key in reported:
+                            continue
+                        reported.add(key)
+                    yield mismatch
@@ -0,0 +1,165 @@
+"""Shared retry policy for outbound calls to Stripe and Twilio
+
+Each dependency gets one RetryPolicy per process, and every call to that
+dependency goes through it:
+
+- retry budget: every call adds budget_ratio tokens to a bucket and every
+  retry takes one out. In normal operation the bucket stays full. When a
+  dependency starts failing everywhere, retries are limited to that fraction
+  of traffic, so the workers do not multiply an outage's load.
+- decorrelated jitter: each delay is drawn between base_delay and three
+  times the previous one (capped at max_delay), which spreads out workers
+  that failed at the same moment
+- Retry-After: a delay the server asks for is honoured up to
+  max_retry_after, and a longer ask means no retry
+- deadline: no retry is started if its delay would end past the call's
+  deadline (seconds after the first attempt) or the request's
+
+Stripe's HTTPClient still decides which responses are retryable (409,
+5xx, Stripe-Should-Retry) and how many retries a call may make
+(stripe.max_network_retries). install_stripe() makes the policy decide
+whether and when each of those retries happens. Other calls go through
+RetryPolicy.call().
+"""
+import random
+import threading
+import time
+
+import deadlines
+
+DEFAULT_BUDGET_RATIO = 0.1
+DEFAULT_DEADLINE_SECONDS = 20.0
+
+_stripe_policy = None
+_stock_request_with_retries_internal = None
+_stock_should_retry = None
+_stock_sleep_time_seconds = None
+
+_installed = False
+
+
+class RetryPolicy:
+    def __init__(self, name, max_retries=2, base_delay=0.5, max_delay=5.0,
+                 budget_ratio=DEFAULT_BUDGET_RATIO, max_tokens=10.0,
+                 deadline=DEFAULT_DEADLINE_SECONDS, max_retry_after=60):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+        self.max_retry_after = max_retry_after
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "over_budget": 0, "past_deadline": 0, "retry_after_too_long": 0}
+
+    def start(self):
+        """Records a call's first attempt; returns its deadline"""
+        with self._lock:
+            self._stats["calls"] += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.budget_ratio)
+        deadline = time.monotonic() + self.deadline
+        request_deadline = deadlines.expires_at()
+        return deadline if request_deadline is None else min(deadline, request_deadline)
+
+    def retry_delay(self, deadline, previous_delay=None, retry_after=None):
+        """Seconds to wait before the next attempt, or None to give up"""
+        delay = min(self.max_delay, random.uniform(self.base_delay, 3 * (previous_delay or self.base_delay)))
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                self._count("retry_after_too_long")
+                return None
+            delay = max(delay, retry_after)
+
+        if time.monotonic() + delay > deadline:
+            self._count("past_deadline")
+            return None
+        with self._lock:
+            if self._tokens < 1:
+                self._stats["over_budget"] += 1
+                return None
+            self._tokens -= 1
+            self._stats["retries"] += 1
+        return delay
+
+    def call(self, fn, retryable, retry_after=lambda error: None):
+        """Calls fn(), retrying errors for which retryable(error) is true"""
+        deadline = self.start()
+        delay = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_retries or not retryable(e):
+                    raise
+                delay = self.retry_delay(deadline, delay, retry_after(e))
+                if delay is None:
+                    raise
+                print(f"Retrying {self.name} call in {delay:.2f}s after: {e}")
+                time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, tokens=round(self._tokens, 2))
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+# Stripe: the stock retry loop asks _should_retry and then
+# _sleep_time_seconds; the policy's decision is made in the first and its
+# delay handed to the second through the client's thread-local state. The
+# async loop (unused here) keeps Stripe's own behaviour.
+
+def _request_with_retries_internal(self, *args, **kwargs):
+    state = self._thread_local
+    state.retry_deadline = _stripe_policy.start()
+    state.retry_delay = None
+    try:
+        return _stock_request_with_retries_internal(self, *args, **kwargs)
+    finally:
+        state.retry_deadline = state.retry_delay = None
+
+
+def _should_retry(self, response, api_connection_error, num_retries, max_network_retries):
+    if not _stock_should_retry(self, response, api_connection_error, num_retries, max_network_retries):
+        return False
+    state = self._thread_local
+    if getattr(state, "retry_deadline", None) is None:
+        return True
+    delay = _stripe_policy.retry_delay(
+        state.retry_deadline, state.retry_delay, self._retry_after_header(response)
+    )
+    if delay is None:
+        return False
+    state.retry_delay = delay
+    return True
+
+
+def _sleep_time_seconds(self, num_retries, response=None):
+    delay = getattr(self._thread_local, "retry_delay", None)
+    if delay is None:
+        return _stock_sleep_time_seconds(self, num_retries, response)
+    return delay
+
+
+def install_stripe(policy):
+    """Routes Stripe's retry decisions through policy; safe to call repeatedly"""
+    global _installed, _stripe_policy
+    global _stock_request_with_retries_internal, _stock_should_retry, _stock_sleep_time_seconds
+    _stripe_policy = policy
+    if _installed:
+        return
+
+    import stripe
+
+    _stock_request_with_retries_internal = stripe.HTTPClient._request_with_retries_internal
+    _stock_should_retry = stripe.HTTPClient._should_retry
+    _stock_sleep_time_seconds = stripe.HTTPClient._sleep_time_seconds
+    stripe.HTTPClient._request_with_retries_internal = _request_with_retries_internal
+    stripe.HTTPClient._should_retry = _should_retry
+    stripe.HTTPClient._sleep_time_seconds = _sleep_time_seconds
+    stripe.max_network_retries = policy.max_retries
+    _installed = True
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+import stripe_codec
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 300
+
+# Event types ending in one of these mean the object in data.object changed
+INVALIDATING_ACTIONS = ("updated", "deleted", "succeeded", "completed")
+
+
+class StripeObjectCache:
+    """Read-through LRU cache of retrieved Stripe objects, invalidated by webhooks
+
+    Entries are stored encoded with stripe_codec, so the memory bound is in
+    bytes and every hit hands back a fresh object the caller may modify.
+    The cache lives in one worker process. The webhook only clears entries
+    in the worker that received it, so the TTL is what bounds staleness in
+    the others.
+
+    A retrieve that misses fetches outside the lock, so an invalidation can
+    land while it waits on Stripe. Every id being fetched has a generation
+    that invalidate() bumps, and a fetch whose id's generation changed is
+    returned to its caller but not cached.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (object_id, expand) -> (expires_at, object_type, data)
+        self._keys_by_id = {}
+        self._fetching = {}  # object_id -> [fetches in flight, generation]
+        self._bytes = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def retrieve(self, resource, object_id, expand=None):
+        """Returns resource.retrieve(object_id, expand=expand), served from cache when fresh"""
+        object_type = resource.OBJECT_NAME
+        key = (object_id, tuple(expand or ()))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(object_type, "hits")
+                data = entry[2]
+            else:
+                if entry is not None:
+                    self._remove(key)
+                self._count(object_type, "misses")
+                data = None
+                fetching = self._fetching.setdefault(object_id, [0, 0])
+                fetching[0] += 1
+                generation = fetching[1]
+
+        if data is not None:
+            return stripe_codec.loads(data)
+
+        try:
+            params = {"expand": list(expand)} if expand else {}
+            obj = resource.retrieve(object_id, **params)
+        except BaseException:
+            with self._lock:
+                self._end_fetch(object_id, generation)
+            raise
+        self.put(object_type, key, obj, generation)
+        return obj
+
+    def put(self, object_type, key, obj, generation=None):
+        """Caches obj under key; generation is the one a retrieve saw before fetching obj
+
+        A put with a generation ends that fetch, and caches obj only if
+        key's object was not invalidated since. Never raises: an object the
+        codec cannot encode is simply not cached.
+        """
+        try:
+            data = stripe_codec.dumps(obj)
+        except Exception as e:
+            print(f"❌ Cannot cache {object_type} {key[0]}: {e}")
+            data = None
+
+        with self._lock:
+            if generation is not None and not self._end_fetch(key[0], generation):
+                self._count(object_type, "stale")
+                return
+            if data is None or len(data) > self.max_bytes:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, object_type, data)
+            self._keys_by_id.setdefault(key[0], set()).add(key)
+            self._bytes += len(data)
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._count(self._entries[oldest][1], "evictions")
+                self._remove(oldest)
+
+    def invalidate(self, object_id):
+        """Drops every cached variant (any expand) of object_id"""
+        with self._lock:
+            fetching = self._fetching.get(object_id)
+            if fetching is not None:
+                fetching[1] += 1
+            for key in list(self._keys_by_id.get(object_id, ())):
+                self._count(self._entries[key][1], "invalidations")
+                self._remove(key)
+
+    def handle_event(self, event):
+        """Invalidates the object an updated/deleted/succeeded/completed event is about"""
+        if event["type"].rsplit(".", 1)[-1] in INVALIDATING_ACTIONS:
+            obj = event["data"]["object"]
+            if obj.get("id"):
+                self.invalidate(obj["id"])
+
+    def stats(self):
+        """Per object type counters and hit ratio, plus overall size"""
+        with self._lock:
+            by_type = {}
+            for object_type, counts in self._stats.items():
+                lookups = counts.get("hits", 0) + counts.get("misses", 0)
+                by_type[object_type] = dict(
+                    counts, hit_ratio=round(counts.get("hits", 0) / lookups, 4) if lookups else None
+                )
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "types": by_type,
+            }
+
+    def _end_fetch(self, object_id, generation):
+        """Ends one fetch of object_id; True if the object was not invalidated during it"""
+        fetching = self._fetching[object_id]
+        fetching[0] -= 1
+        if not fetching[0]:
+            del self._fetching[object_id]
+        return fetching[1] == generation
+
+    def _remove(self, key):
+        _, _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+        keys = self._keys_by_id.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[key[0]]
+
+    def _count(self, object_type, name):
+        counts = self._stats.setdefault(object_type, {})
+        counts[name] = counts.get(name, 0) + 1
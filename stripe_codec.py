@@ -0,0 +1,247 @@
+"""Compact binary encoding of StripeObjects for caches
+
+Layout: MAGIC, one VERSION byte, then a single tagged value. Strings up to
+MAX_INTERNED_LENGTH bytes are written once and referenced by index after
+that, so repeated keys ("object", "currency", "metadata") and class names
+cost a byte or two. Every StripeObject keeps its class, and decoding builds
+each object directly as that class instead of dispatching on its "object"
+field, so a decoded tree matches the one the API call returned.
+
+Only what a cache needs is kept: class and values. Requestor state (API
+key, account) is not stored; decoded objects use the requestor passed to
+loads(), the global one by default.
+
+Class names in a payload are only resolved to StripeObject subclasses from
+the stripe package, so decoding never imports or calls anything else.
+Malformed or truncated payloads raise ValueError.
+"""
+import struct
+from importlib import import_module
+
+MAGIC = b"SO"
+VERSION = 1
+
+MAX_INTERNED_LENGTH = 64
+
+_NONE = 0x00
+_FALSE = 0x01
+_TRUE = 0x02
+_INT = 0x03
+_FLOAT = 0x04
+_STR_NEW = 0x05
+_STR_REF = 0x06
+_STR_RAW = 0x07
+_LIST = 0x08
+_DICT = 0x09
+_OBJECT = 0x0A
+
+_double = struct.Struct(">d")
+
+# "module:qualname" -> class, filled as classes are first seen
+_classes = {}
+
+
+def _class_path(klass):
+    return "%s:%s" % (klass.__module__, klass.__qualname__)
+
+
+def _resolve_class(path):
+    klass = _classes.get(path)
+    if klass is None:
+        if not isinstance(path, str):
+            raise ValueError("Invalid class name %r" % (path,))
+        module, _, qualname = path.partition(":")
+        if module != "stripe" and not module.startswith("stripe."):
+            raise ValueError("Not a stripe class: %s" % path)
+        try:
+            klass = import_module(module)
+            for name in qualname.split("."):
+                klass = getattr(klass, name)
+        except (ImportError, AttributeError) as e:
+            raise ValueError("Unknown class %s" % path) from e
+        from stripe import StripeObject
+
+        if not isinstance(klass, type) or not issubclass(klass, StripeObject):
+            raise ValueError("Not a StripeObject class: %s" % path)
+        _classes[path] = klass
+    return klass
+
+
+class _Encoder:
+    def __init__(self):
+        from stripe import StripeObject
+
+        self.StripeObject = StripeObject
+        self.out = bytearray(MAGIC)
+        self.out.append(VERSION)
+        self.strings = {}
+
+    def varint(self, n):
+        out = self.out
+        while n > 0x7F:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def string(self, s):
+        ref = self.strings.get(s)
+        if ref is not None:
+            self.out.append(_STR_REF)
+            self.varint(ref)
+            return
+        data = s.encode("utf-8")
+        if len(data) <= MAX_INTERNED_LENGTH:
+            self.strings[s] = len(self.strings)
+            self.out.append(_STR_NEW)
+        else:
+            self.out.append(_STR_RAW)
+        self.varint(len(data))
+        self.out += data
+
+    def value(self, v):
+        out = self.out
+        if v is None:
+            out.append(_NONE)
+        elif v is True:
+            out.append(_TRUE)
+        elif v is False:
+            out.append(_FALSE)
+        elif isinstance(v, str):
+            self.string(v)
+        elif isinstance(v, int):
+            out.append(_INT)
+            # Zigzag so small negative numbers stay short
+            self.varint(v * 2 if v >= 0 else -v * 2 - 1)
+        elif isinstance(v, float):
+            out.append(_FLOAT)
+            out += _double.pack(v)
+        elif isinstance(v, self.StripeObject):
+            out.append(_OBJECT)
+            self.string(_class_path(type(v)))
+            self.mapping(v)
+        elif isinstance(v, dict):
+            out.append(_DICT)
+            self.mapping(v)
+        elif isinstance(v, (list, tuple)):
+            out.append(_LIST)
+            self.varint(len(v))
+            for item in v:
+                self.value(item)
+        else:
+            raise TypeError("Cannot encode %s value %r" % (type(v).__name__, v))
+
+    def mapping(self, d):
+        # dict's own methods: ListObject overrides len() and iteration
+        self.varint(dict.__len__(d))
+        for k, v in dict.items(d):
+            self.string(k)
+            self.value(v)
+
+
+class _Decoder:
+    def __init__(self, data, requestor):
+        self.data = data
+        self.pos = 3
+        self.strings = []
+        self.requestor = requestor
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        result = 0
+        shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return result
+
+    def raw_string(self):
+        n = self.varint()
+        start = self.pos
+        self.pos = start + n
+        if self.pos > len(self.data):
+            raise ValueError("Truncated string at offset %d" % start)
+        return str(self.data[start:self.pos], "utf-8")
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _STR_REF:
+            return self.strings[self.varint()]
+        if tag == _STR_NEW:
+            s = self.raw_string()
+            self.strings.append(s)
+            return s
+        if tag == _INT:
+            n = self.varint()
+            return n >> 1 if not n & 1 else -((n + 1) >> 1)
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _OBJECT:
+            return self.stripe_object(_resolve_class(self.value()))
+        if tag == _DICT:
+            return self.mapping()
+        if tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == _STR_RAW:
+            return self.raw_string()
+        if tag == _FLOAT:
+            start = self.pos
+            self.pos = start + 8
+            return _double.unpack_from(self.data, start)[0]
+        raise ValueError("Unknown tag 0x%02x at offset %d" % (tag, self.pos - 1))
+
+    def mapping(self):
+        d = {}
+        for _ in range(self.varint()):
+            k = self.value()
+            d[k] = self.value()
+        return d
+
+    def stripe_object(self, klass):
+        values = self.mapping()
+        # Same state _construct_from leaves behind, without _refresh_from
+        # converting every value again
+        obj = klass(None, _requestor=self.requestor)
+        dict.update(obj, values)
+        obj._previous = values
+        return obj
+
+
+def dumps(obj):
+    """Encodes a StripeObject (or any JSON-like value containing them) to bytes"""
+    encoder = _Encoder()
+    encoder.value(obj)
+    return bytes(encoder.out)
+
+
+def loads(data, requestor=None):
+    """Decodes bytes from dumps(); raises ValueError on foreign, newer or damaged data"""
+    if len(data) < 3 or data[:2] != MAGIC:
+        raise ValueError("Not a stripe_codec payload")
+    if data[2] != VERSION:
+        raise ValueError("Unsupported stripe_codec version %d" % data[2])
+
+    if requestor is None:
+        from stripe import _APIRequestor
+
+        requestor = _APIRequestor._global_instance()
+
+    decoder = _Decoder(memoryview(data), requestor)
+    try:
+        value = decoder.value()
+    except (IndexError, TypeError, struct.error) as e:
+        # Reading past the end, or a non-string key from damaged data
+        raise ValueError("Corrupt stripe_codec payload: %s" % e) from e
+    if decoder.pos != len(data):
+        raise ValueError("Trailing bytes after offset %d" % decoder.pos)
+    return value
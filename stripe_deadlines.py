@@ -0,0 +1,38 @@
+"""Stripe HTTP client whose timeout follows the current request's deadline
+
+RequestsClient passes self._timeout to requests on every call; here that
+attribute is computed per call from deadlines.call_timeout(), so a Stripe
+call never waits past the request's deadline, and no call is started once
+it has passed.
+"""
+import stripe
+
+import deadlines
+
+
+class DeadlineRequestsClient(stripe.RequestsClient):
+    name = "requests-deadline"
+
+    @property
+    def _timeout(self):
+        return deadlines.call_timeout(self.max_timeout)
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self.max_timeout = value
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        deadlines.call_timeout()
+        return super().request(method, url, headers, post_data)
+
+    def request_stream(self, method, url, headers, post_data=None, **kwargs):
+        deadlines.call_timeout()
+        return super().request_stream(method, url, headers, post_data)
+
+
+def install(timeout):
+    """Makes DeadlineRequestsClient the default unless another client was set"""
+    if stripe.default_http_client is None:
+        stripe.default_http_client = DeadlineRequestsClient(
+            timeout=timeout, verify_ssl_certs=stripe.verify_ssl_certs, proxy=stripe.proxy
+        )
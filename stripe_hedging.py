@@ -0,0 +1,213 @@
+"""Hedged Stripe requests: a second attempt when the first is slow
+
+Most of /pay's tail latency is a few checkout session creates that take
+several times longer than usual. When a request carrying an Idempotency-Key
+(every Stripe POST has one) hasn't answered within the recent
+HEDGE_PERCENTILE latency for its endpoint, HedgingHTTPClient sends the same
+request again, with the same key, and returns whichever response arrives
+first. The slower attempt is cancelled if it hasn't started, and ignored
+otherwise.
+
+The shared key makes this safe: Stripe executes the call once. A duplicate
+that arrives while the original is still being processed gets a 409
+idempotency error, which is never returned while the other attempt may
+still succeed. Hedging therefore pays off when the first attempt is stuck
+before it reaches Stripe (connection setup, packet loss), not when Stripe
+itself is slow.
+
+Hedges are limited by a token bucket: every keyed request adds
+budget_ratio tokens and a hedge costs one, so at most that fraction of
+extra requests is sent, even when everything is slow. Off by default;
+STRIPE_HEDGING=1 turns it on.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import stripe
+
+DEFAULT_BUDGET_RATIO = 0.05
+DEFAULT_PERCENTILE = 0.95
+
+# Until an endpoint has this many samples there is no delay to hedge at
+MIN_SAMPLES = 20
+WINDOW_SIZE = 500
+MIN_DELAY = 0.05
+MAX_DELAY = 5.0
+
+MAX_IN_FLIGHT = 32
+
+_client = None
+_lock = threading.Lock()
+
+
+class _LatencyWindow:
+    """The last WINDOW_SIZE latencies of one endpoint"""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)
+        self.lock = threading.Lock()
+        self._sorted = None
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self._sorted = None
+
+    def percentile(self, q):
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self.samples)
+            return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class _Budget:
+    """Token bucket that caps hedges at a fraction of requests"""
+
+    def __init__(self, ratio, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _has_idempotency_key(headers):
+    return any(name.lower() == "idempotency-key" for name in headers or ())
+
+
+class HedgingHTTPClient(stripe.HTTPClient):
+    name = "hedging"
+
+    def __init__(self, inner, budget_ratio=DEFAULT_BUDGET_RATIO, percentile=DEFAULT_PERCENTILE):
+        super().__init__()
+        self.inner = inner
+        self.percentile = percentile
+        self.budget = _Budget(budget_ratio)
+        self._windows = {}
+        self._executor = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="stripe-hedge")
+        self._stats = {"requests": 0, "hedged": 0, "hedge_won": 0, "over_budget": 0}
+        self._stats_lock = threading.Lock()
+
+    def request(self, method, url, headers, post_data=None, **kwargs):
+        if not _has_idempotency_key(headers):
+            return self.inner.request(method, url, headers, post_data)
+
+        route = (method, urlsplit(url).path)
+        window = self._windows.get(route)
+        if window is None:
+            window = self._windows.setdefault(route, _LatencyWindow())
+        self.budget.deposit()
+        self._count("requests")
+
+        delay = window.percentile(self.percentile)
+        primary = self._submit(window, method, url, headers, post_data)
+        if delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=min(MAX_DELAY, max(MIN_DELAY, delay)))
+        if done:
+            return primary.result()
+        if not self.budget.withdraw():
+            self._count("over_budget")
+            return primary.result()
+
+        self._count("hedged")
+        hedge = self._submit(window, method, url, headers, post_data)
+        winner, response = self._first_response([primary, hedge])
+        if winner is hedge:
+            self._count("hedge_won")
+        return response
+
+    def _submit(self, window, method, url, headers, post_data):
+        start = time.monotonic()
+        future = self._executor.submit(
+            contextvars.copy_context().run, self.inner.request, method, url, headers, post_data
+        )
+
+        def record(f):
+            # Includes attempts that lost, so the window keeps the real tail
+            if not f.cancelled() and f.exception() is None:
+                window.add(time.monotonic() - start)
+
+        future.add_done_callback(record)
+        return future
+
+    def _first_response(self, futures):
+        """Returns (future, response) for the first usable response
+
+        A 409 (the other attempt holds the idempotency key) or an error is
+        only returned once no other attempt is left to wait for.
+        """
+        pending = set(futures)
+        conflict = error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                elif future.result()[1] == 409:
+                    conflict = conflict or (future, future.result())
+                else:
+                    for loser in pending:
+                        loser.cancel()
+                    return future, future.result()
+        if conflict is not None:
+            return conflict
+        raise error
+
+    def request_stream(self, method, url, headers, post_data=None, **kwargs):
+        return self.inner.request_stream(method, url, headers, post_data)
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["delays"] = {
+            "%s %s" % route: window.percentile(self.percentile)
+            for route, window in list(self._windows.items())
+        }
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+
+def install(budget_ratio=DEFAULT_BUDGET_RATIO, percentile=DEFAULT_PERCENTILE):
+    """Wraps stripe.default_http_client; safe to call repeatedly
+
+    The wrapper (and the latencies it has learned) is kept as long as the
+    client underneath stays the same.
+    """
+    global _client
+    with _lock:
+        stripe.ensure_default_http_client()
+        current = stripe.default_http_client
+        if current is _client:
+            return
+        if _client is None or _client.inner is not current:
+            _client = HedgingHTTPClient(current, budget_ratio=budget_ratio, percentile=percentile)
+        stripe.default_http_client = _client
+
+
+def stats():
+    """Counters and current hedge delay per endpoint, or None when not installed"""
+    return _client.stats() if _client is not None else None
@@ -0,0 +1,147 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_CONCURRENT_FETCHES = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_FETCHES, thread_name_prefix="stripe-loader"
+            )
+        return _executor
+
+
+class Pending:
+    """Handle for an object the loader will fetch; get() dispatches if needed"""
+
+    def __init__(self, loader, root, path=()):
+        self._loader = loader
+        self._root = root
+        self._path = path
+        self._done = False
+        self._value = None
+        self._error = None
+
+    def get(self):
+        if not self._done:
+            self._loader.dispatch()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _resolve(self, value, error):
+        self._value = value
+        self._error = error
+        self._done = True
+
+
+class StripeLoader:
+    """Per-request batching of Stripe retrieves, DataLoader style
+
+    load() and load_field() only record what is needed. The first get() (or
+    an explicit dispatch()) plans and runs the fetches:
+
+    - the same object requested twice is fetched once
+    - related objects reached through load_field() are folded into their
+      parent's retrieve as expand[] paths, so they cost no extra request
+    - retrieves of unrelated objects run concurrently
+
+    A handler needing a session, its payment intent, customer and line items
+    therefore makes a single request instead of four:
+
+        session = loader.load(stripe.checkout.Session, session_id)
+        intent = loader.load_field(session, "payment_intent")
+        customer = loader.load_field(session, "customer")
+        line_items = loader.load_field(session, "line_items")
+        print(intent.get().amount, customer.get().email)
+
+    Fetches go through the StripeObjectCache when one is given.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._requests = {}  # (resource, id) -> {"resource", "id", "expand", "handle"}
+        self._fields = []  # handles resolved from a parent's expanded value
+        self._lock = threading.Lock()
+
+    def load(self, resource, object_id, expand=()):
+        key = (resource, object_id)
+        request = self._requests.get(key)
+        if request is not None and request["handle"]._done and request["expand"].issuperset(expand):
+            # Already fetched with everything asked for
+            return request["handle"]
+        if request is None or request["handle"]._done:
+            request = {
+                "resource": resource,
+                "id": object_id,
+                "expand": set(request["expand"]) if request else set(),
+                "handle": Pending(self, key),
+            }
+            self._requests[key] = request
+        request["expand"].update(expand)
+        return request["handle"]
+
+    def load_field(self, parent, field):
+        """Loads the object parent.<field> points at by expanding it on the parent's retrieve"""
+        path = parent._path + (field,)
+        request = self._requests[parent._root]
+        if request["handle"]._done:
+            # Too late to fold into the parent; fetch it again with the expansion
+            request = self._requests[parent._root] = dict(
+                request, expand=set(request["expand"]), handle=Pending(self, parent._root)
+            )
+        request["expand"].add(".".join(path))
+        handle = Pending(self, parent._root, path)
+        self._fields.append(handle)
+        return handle
+
+    def dispatch(self):
+        """Fetches everything still pending"""
+        with self._lock:
+            pending = [r for r in self._requests.values() if not r["handle"]._done]
+            if len(pending) == 1:
+                self._fetch(pending[0])
+            elif pending:
+                executor = _get_executor()
+                futures = [executor.submit(contextvars.copy_context().run, self._fetch, r) for r in pending]
+                for future in futures:
+                    future.result()
+
+            for handle in self._fields:
+                if not handle._done:
+                    self._resolve_field(handle)
+            self._fields = [h for h in self._fields if not h._done]
+
+    def _fetch(self, request):
+        expand = sorted(request["expand"])
+        try:
+            if self.cache is not None:
+                value = self.cache.retrieve(request["resource"], request["id"], expand=expand)
+            else:
+                params = {"expand": expand} if expand else {}
+                value = request["resource"].retrieve(request["id"], **params)
+        except Exception as e:
+            request["handle"]._resolve(None, e)
+        else:
+            request["handle"]._resolve(value, None)
+
+    def _resolve_field(self, handle):
+        root = self._requests[handle._root]["handle"]
+        if root._error is not None:
+            handle._resolve(None, root._error)
+            return
+        value = root._value
+        try:
+            for name in handle._path:
+                value = value[name]
+        except (KeyError, TypeError) as e:
+            handle._resolve(None, e)
+        else:
+            handle._resolve(value, None)
@@ -0,0 +1,105 @@
+"""Coalesces concurrent identical Stripe GET requests into one HTTP call
+
+When several threads retrieve the same Price, Product or Customer at once,
+the first one (the leader) makes the request and the others wait for its
+raw response. Coalescing happens at _APIRequestor.request_raw, below
+response parsing, so every caller still interprets the response itself:
+each gets its own StripeObject, and an API error is raised in every caller.
+
+Only non-streaming GETs are coalesced. Two requests are identical when the
+method, URL, encoded params, request options and the requestor's
+API key, account and version all match. On by default; STRIPE_SINGLEFLIGHT=0
+turns it off.
+"""
+import threading
+from urllib.parse import urlencode
+
+import deadlines
+
+_stock_request_raw = None
+_calls = {}
+_lock = threading.Lock()
+_stats = {"leaders": 0, "followers": 0}
+
+_installed = False
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _key(requestor, method, url, params, options, base_address, api_mode):
+    from stripe._encode import _api_encode
+
+    return (
+        method,
+        url,
+        base_address,
+        api_mode,
+        urlencode(list(_api_encode(params or {}, api_mode))),
+        tuple(sorted((k, repr(v)) for k, v in (options or {}).items())),
+        requestor.api_key,
+        requestor.stripe_account,
+        requestor.stripe_version,
+    )
+
+
+def _request_raw(self, method, url, params=None, options=None, is_streaming=False, **kwargs):
+    if method != "get" or is_streaming:
+        return _stock_request_raw(self, method, url, params, options, is_streaming, **kwargs)
+
+    key = _key(self, method, url, params, options, kwargs.get("base_address"), kwargs.get("api_mode"))
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+            _stats["leaders"] += 1
+        else:
+            _stats["followers"] += 1
+
+    if not leader:
+        if not call.done.wait(deadlines.call_timeout()):
+            raise deadlines.DeadlineExceeded("Request deadline exceeded waiting for %s %s" % (method.upper(), url))
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _stock_request_raw(self, method, url, params, options, is_streaming, **kwargs)
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+    return call.result
+
+
+def stats():
+    """Requests made (leaders) and requests that shared another's response (followers)"""
+    with _lock:
+        return dict(_stats, in_flight=len(_calls))
+
+
+def install():
+    """Wraps _APIRequestor.request_raw; safe to call repeatedly"""
+    global _installed, _stock_request_raw
+    if _installed:
+        return
+
+    # Written against the internals of stripe 11.x; leave older releases alone
+    try:
+        from stripe._api_requestor import _APIRequestor
+    except ImportError as e:
+        print(f"❌ stripe_singleflight not installed, unsupported stripe version: {e}")
+        _installed = True
+        return
+
+    _stock_request_raw = _APIRequestor.request_raw
+    _APIRequestor.request_raw = _request_raw
+    _installed = True
@@ -0,0 +1,382 @@
+"""Drop-in replacements for hot internal helpers of the stripe package
+
+Enabled with STRIPE_SPEEDUPS=1. Each replacement produces exactly the same
+result as the function it replaces; benchmarks/ has a script per helper that
+checks this against the original and times both.
+
+StripeObjects are also made compact: the private bookkeeping every one of
+them carries (_unsaved_values, _transient_values, _retrieve_params) starts
+out as shared empty values instead of a set or dict per object, and an
+object gets sets of its own only once it is written to.
+benchmarks/stripe_object_memory.py measures the difference.
+"""
+import datetime
+from types import MappingProxyType
+from urllib.parse import quote_plus, urlencode as _urlencode
+
+try:
+    from stripe._encode import _encode_datetime
+except ImportError:  # unsupported stripe version; install() reports it
+    _encode_datetime = None
+
+# Request bodies reuse the same few hundred keys ("line_items[0][quantity]"),
+# so their quoted form is cached; cleared when full to bound memory
+QUOTED_KEY_CACHE_SIZE = 4096
+_quoted_keys = {}
+
+# Shared requestors keyed by the options they would be built with
+REQUESTOR_CACHE_SIZE = 64
+_requestors = {}
+
+# Shared by every StripeObject until its first write; an empty set costs
+# 216 bytes and an empty dict 64, per object of every response
+_NO_KEYS = frozenset()
+_NO_PARAMS = MappingProxyType({})
+
+_object_classes = None
+_thin_event_classes = None
+_StripeObject = None
+_StripeResponse = None
+_V2ListObject = None
+_stock_setitem = None
+
+_installed = False
+
+
+def api_encode(data, api_mode):
+    """Iterative equivalent of stripe._encode._api_encode that returns a list of pairs
+
+    The original recurses through a generator per nested dict and copies
+    each one into an OrderedDict with its keys rewritten. Here every bracketed
+    key is formatted once, as it is reached, and appended straight to the
+    output list.
+    """
+    pairs = []
+    append = pairs.append
+    v2 = api_mode == "V2"
+
+    # Each frame is (prefix, is_list, iterator). Dict frames yield
+    # (subkey, value) and list frames yield (index, value), so nested
+    # structures are flattened depth first in the same order as the original.
+    stack = [(None, False, iter(data.items()))]
+    while stack:
+        prefix, is_list, items = stack[-1]
+        for key, value in items:
+            if is_list:
+                key = prefix if v2 else "%s[%d]" % (prefix, key)
+                if isinstance(value, dict):
+                    stack.append((key, False, iter(value.items())))
+                    break
+                append((key, value))
+                continue
+
+            if prefix is not None:
+                key = "%s[%s]" % (prefix, key)
+
+            if value is None:
+                continue
+            elif hasattr(value, "stripe_id"):
+                append((key, value.stripe_id))
+            elif isinstance(value, list) or isinstance(value, tuple):
+                stack.append((key, True, enumerate(value)))
+                break
+            elif isinstance(value, dict):
+                stack.append((key, False, iter(value.items())))
+                break
+            elif isinstance(value, datetime.datetime):
+                append((key, _encode_datetime(value)))
+            else:
+                append((key, value))
+        else:
+            stack.pop()
+
+    return pairs
+
+
+def urlencode(query, doseq=False, **kwargs):
+    """urllib.parse.urlencode specialised for the list of pairs api_encode returns"""
+    if doseq or kwargs or not isinstance(query, list):
+        return _urlencode(query, doseq, **kwargs)
+
+    quoted_keys = _quoted_keys
+    parts = []
+    append = parts.append
+    for k, v in query:
+        if type(k) is str:
+            quoted = quoted_keys.get(k)
+            if quoted is None:
+                quoted = quote_plus(k)
+                if len(quoted_keys) >= QUOTED_KEY_CACHE_SIZE:
+                    quoted_keys.clear()
+                quoted_keys[k] = quoted
+        else:
+            quoted = quote_plus(k) if isinstance(k, bytes) else quote_plus(str(k))
+        if isinstance(v, bytes):
+            append(quoted + "=" + quote_plus(v))
+        else:
+            append(quoted + "=" + quote_plus(str(v)))
+    return "&".join(parts)
+
+
+def get_object_classes(api_mode):
+    """Same tables as stripe._util.get_object_classes, resolved once instead of per node"""
+    return _object_classes["V2"] if api_mode == "V2" else _object_classes["V1"]
+
+
+def _convert_to_stripe_object(*, resp, params=None, klass_=None, requestor, api_mode):
+    """stripe._util._convert_to_stripe_object without the per-call imports and lookups
+
+    Called once for every nested value of every response, so the imports and
+    class tables the original resolves on each call are bound once at install.
+    """
+    stripe_response = None
+
+    if isinstance(resp, _StripeResponse):
+        stripe_response = resp
+        resp = stripe_response.data
+
+    if isinstance(resp, list):
+        return [
+            _convert_to_stripe_object(
+                resp=i,
+                requestor=requestor,
+                api_mode=api_mode,
+                klass_=klass_,
+            )
+            for i in resp
+        ]
+    elif isinstance(resp, dict) and not isinstance(resp, _StripeObject):
+        resp = resp.copy()
+        klass_name = resp.get("object")
+        if isinstance(klass_name, str):
+            if api_mode == "V2" and klass_name == "v2.core.event":
+                klass = _thin_event_classes.get(resp.get("type", ""), _StripeObject)
+            else:
+                klass = get_object_classes(api_mode).get(klass_name, _StripeObject)
+        elif "data" in resp and "next_page_url" in resp:
+            klass = _V2ListObject
+        elif klass_ is not None:
+            klass = klass_
+        else:
+            klass = _StripeObject
+
+        obj = klass._construct_from(
+            values=resp,
+            last_response=stripe_response,
+            requestor=requestor,
+            api_mode=api_mode,
+        )
+
+        if (
+            params is not None
+            and hasattr(obj, "object")
+            and (obj.object == "list" or obj.object == "search_result")
+        ):
+            obj._retrieve_params = params
+
+        return obj
+    else:
+        return resp
+
+
+def _refresh_from(self, *, values, partial=False, last_response=None, requestor=None, api_mode):
+    """StripeObject._refresh_from that stores plain values without a conversion call
+
+    Most fields of a response are strings, numbers or None, which the
+    original still routes through _convert_to_stripe_object one at a time.
+    Only dicts, lists and fields with declared inner classes take that path.
+    """
+    self._requestor = requestor or self._requestor
+    self._last_response = last_response or getattr(values, "_last_response", None)
+
+    # Same bookkeeping as the original, but empty results stay the shared
+    # _NO_KEYS instead of becoming new empty sets
+    if partial:
+        if self._unsaved_values:
+            self._unsaved_values = self._unsaved_values - set(values)
+    else:
+        removed = self.keys() - values.keys()
+        if removed:
+            self._transient_values = self._transient_values | removed
+        self._unsaved_values = _NO_KEYS
+        self.clear()
+
+    if self._transient_values:
+        self._transient_values = (self._transient_values - set(values)) or _NO_KEYS
+
+    requestor = self._requestor
+    inner_class_types = self._inner_class_types
+    inner_class_dicts = self._inner_class_dicts
+    setitem = dict.__setitem__
+    for k, v in values.items():
+        if k in inner_class_dicts:
+            inner_class = inner_class_types.get(k)
+            obj = {
+                k: None
+                if v is None
+                else _convert_to_stripe_object(
+                    resp=v,
+                    params=None,
+                    klass_=inner_class,
+                    requestor=requestor,
+                    api_mode=api_mode,
+                )
+                for k, v in v.items()
+            }
+        elif isinstance(v, (dict, list, _StripeResponse)):
+            obj = _convert_to_stripe_object(
+                resp=v,
+                params=None,
+                klass_=inner_class_types.get(k),
+                requestor=requestor,
+                api_mode=api_mode,
+            )
+        else:
+            obj = v
+        setitem(self, k, obj)
+
+    self._previous = values
+
+
+def _init(self, id=None, api_key=None, stripe_version=None, stripe_account=None, last_response=None, *,
+          _requestor=None, **params):
+    """StripeObject.__init__ that shares empty bookkeeping between objects
+
+    The original gives every object two empty sets and a dict of its own,
+    though almost none of the objects in a response are ever written to.
+    """
+    dict.__init__(self)
+    self._unsaved_values = _NO_KEYS
+    self._transient_values = _NO_KEYS
+    self._last_response = last_response
+    self._retrieve_params = params or _NO_PARAMS
+    self._previous = None
+    self._requestor = (
+        global_with_options(api_key=api_key, stripe_version=stripe_version, stripe_account=stripe_account)
+        if _requestor is None
+        else _requestor
+    )
+    if id:
+        dict.__setitem__(self, "id", id)
+        self._unsaved_values = {"id"}
+
+
+def _update(self, update_dict):
+    """StripeObject.update that gives the object its own _unsaved_values first"""
+    if type(self._unsaved_values) is not set:
+        self._unsaved_values = set(self._unsaved_values)
+    self._unsaved_values.update(update_dict)
+    dict.update(self, update_dict)
+
+
+def _getattr(self, k):
+    """StripeObject.__getattr__ that reads the dict directly on a hit"""
+    if k[0] == "_":
+        raise AttributeError(k)
+
+    remappings = self._field_remappings
+    if remappings and k in remappings:
+        k = remappings[k]
+    try:
+        return dict.__getitem__(self, k)
+    except KeyError:
+        pass
+
+    # Miss: go through __getitem__ for its hint about wiped transient values
+    try:
+        return self[k]
+    except KeyError as err:
+        raise AttributeError(*err.args) from err
+
+
+def _setitem(self, k, v):
+    """StripeObject.__setitem__ without the hasattr check on every write"""
+    if v == "":
+        return _stock_setitem(self, k, v)
+
+    try:
+        self._unsaved_values.add(k)
+    except AttributeError:
+        # Still the shared empty _NO_KEYS, or unset because unpickling sets
+        # items before __init__ has run
+        self._unsaved_values = {k}
+    dict.__setitem__(self, k, v)
+
+
+def global_with_options(**params):
+    """Cached equivalent of _APIRequestor._global_with_options
+
+    The original snapshots the global settings (stripe.api_key, api_base, ...)
+    into a new requestor on every call. Those settings are part of the cache
+    key, so a cached requestor is only reused while they are unchanged.
+    """
+    from stripe._api_requestor import _APIRequestor
+
+    instance = _APIRequestor._global_instance()
+    options = instance._options
+    key = (
+        params.get("api_key"),
+        params.get("stripe_account"),
+        params.get("stripe_version"),
+        options.api_key,
+        options.stripe_account,
+        options.stripe_context,
+        options.stripe_version,
+        tuple(options.base_addresses.items()),
+        options.max_network_retries,
+        id(instance._client),
+    )
+    requestor = _requestors.get(key)
+    if requestor is None:
+        requestor = instance._replace_options(params)
+        if len(_requestors) >= REQUESTOR_CACHE_SIZE:
+            _requestors.clear()
+        _requestors[key] = requestor
+    return requestor
+
+
+def install():
+    """Swaps the replacements into the stripe package; safe to call repeatedly"""
+    global _installed
+    if _installed:
+        return
+
+    # Written against the internals of stripe 11.x; leave older releases alone
+    try:
+        import stripe
+        import stripe._api_requestor
+        import stripe._stripe_client
+        import stripe._util
+        from stripe._object_classes import OBJECT_CLASSES, V2_OBJECT_CLASSES
+        from stripe._stripe_object import StripeObject
+        from stripe._stripe_response import StripeResponse
+        from stripe.events._event_classes import THIN_EVENT_CLASSES
+    except ImportError as e:
+        print(f"❌ stripe_speedups not installed, unsupported stripe version: {e}")
+        _installed = True
+        return
+
+    global _object_classes, _thin_event_classes, _StripeObject, _StripeResponse, _V2ListObject, _stock_setitem
+    _object_classes = MappingProxyType({
+        "V1": MappingProxyType(dict(OBJECT_CLASSES)),
+        "V2": MappingProxyType(dict(V2_OBJECT_CLASSES)),
+    })
+    _thin_event_classes = MappingProxyType(dict(THIN_EVENT_CLASSES))
+    _StripeObject = StripeObject
+    _StripeResponse = StripeResponse
+    _V2ListObject = stripe.v2.ListObject
+    _stock_setitem = StripeObject.__setitem__
+
+    stripe._api_requestor._api_encode = api_encode
+    stripe._api_requestor.urlencode = urlencode
+    stripe._util.get_object_classes = get_object_classes
+    stripe._util._convert_to_stripe_object = _convert_to_stripe_object
+    stripe._api_requestor._convert_to_stripe_object = _convert_to_stripe_object
+    stripe._stripe_client._convert_to_stripe_object = _convert_to_stripe_object
+    stripe._api_requestor._APIRequestor._global_with_options = staticmethod(global_with_options)
+    StripeObject.__init__ = _init
+    StripeObject.update = _update
+    StripeObject._refresh_from = _refresh_from
+    StripeObject.__getattr__ = _getattr
+    StripeObject.__setitem__ = _setitem
+    _installed = True
@@ -0,0 +1,82 @@
+"""Pre-fork warm-up so gunicorn workers share as much memory as possible
+
+With preload_app, the master imports the app once and forks every worker
+from it, and the forked pages stay shared until someone writes to them.
+Anything a worker loads for itself (the stripe and twilio module graphs,
+compiled templates, the HTTP client) is private to that worker, so warm()
+loads all of it in the master first.
+
+Sharing also breaks when objects are merely touched: each reference count
+change or garbage collector pass writes to the object's page. gc.freeze()
+moves everything alive in the master into a generation the collector never
+scans, so the children leave those pages alone. gunicorn.conf.py calls
+prefork() just before each fork, and postfork() in each new worker.
+"""
+import gc
+
+_warmed = False
+
+
+def warm(app):
+    """Imports and compiles everything a request would otherwise load lazily"""
+    with app.app_context():
+        from app import get_stripe
+
+        stripe = get_stripe()
+        # The response -> object class table
+        from stripe._util import get_object_classes
+        get_object_classes("V1")
+        # The HTTP client (and requests/urllib3/ssl behind it) is otherwise
+        # created on the first API call; its sessions are per thread
+        stripe.ensure_default_http_client()
+
+        try:
+            from twilio.rest import Client
+            # Placeholder credentials: nothing is sent, this only resolves
+            # the lazily imported Messaging and Accounts modules
+            Client("AC" + "0" * 32, "warmup").messages
+        except Exception as e:
+            print(f"❌ Twilio warm-up skipped: {e}")
+
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
+        # sqlite3 connections must not cross a fork
+        app.extensions["ledger"].close()
+
+
+def prefork(app):
+    """Warms up on the first call, then freezes the master's heap before a fork"""
+    global _warmed
+    if not _warmed:
+        warm(app)
+        gc.collect()
+        _warmed = True
+    gc.freeze()
+
+
+def postfork(app):
+    """Starts the worker's background threads, which do not survive a fork"""
+    pool = app.extensions.get("checkout_pool")
+    if pool is not None:
+        pool.start()
+
+
+def memory_usage(pid="self"):
+    """Returns {"rss", "pss", "uss"} in bytes for a process, or None off Linux
+
+    uss (unique set size) is what the process alone holds: the memory that
+    would be freed if it exited, and what each additional worker costs.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            next(f)  # address range header
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    kb = lambda name: int(fields.get(name, "0 kB").split()[0]) * 1024
+    return {
+        "rss": kb("Rss"),
+        "pss": kb("Pss"),
+        "uss": kb("Private_Clean") + kb("Private_Dirty"),
+    }
@@ -0,0 +1,91 @@
+"""Stripe webhook signature check done while the body is read
+
+stripe.WebhookSignature.verify_header needs the body as a str: Flask buffers
+it, decodes it, and the SDK then builds "<timestamp>.<body>" and encodes it
+back to UTF-8 to hash it, so a large event is held about four times over.
+read_verified() instead reads the request stream in chunks into one
+preallocated buffer and feeds each chunk to the HMAC as it arrives, after
+the "<timestamp>." prefix. The signature it computes is the same.
+
+Cheap checks come first: a malformed or stale Stripe-Signature header, or a
+Content-Length over the limit, is rejected before any of the body is read.
+"""
+import hmac
+import time
+from hashlib import sha256
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_BYTES = 1024 * 1024
+EXPECTED_SCHEME = "v1"
+
+
+def _verification_error(message, header):
+    import stripe
+
+    return stripe.SignatureVerificationError(message, header)
+
+
+def _parse_header(header):
+    try:
+        # Items without "=" (a trailing comma, say) are skipped, not fatal
+        items = [item.split("=", 1) for item in header.split(",") if "=" in item]
+        timestamp = int(next(value for key, value in items if key == "t"))
+        signatures = [value for key, value in items if key == EXPECTED_SCHEME]
+    except Exception:
+        raise _verification_error("Unable to extract timestamp and signatures from header", header)
+    if not signatures:
+        raise _verification_error("No signatures found with expected scheme %s" % EXPECTED_SCHEME, header)
+    return timestamp, signatures
+
+
+def _too_large(max_bytes):
+    return RequestEntityTooLarge("Webhook body is larger than %d bytes" % max_bytes)
+
+
+def read_verified(stream, content_length, header, secret, tolerance=300, max_bytes=DEFAULT_MAX_BYTES):
+    """Reads a webhook body from stream and checks its Stripe-Signature header
+
+    Returns the body as a bytearray, which json.loads parses in place.
+    Raises RequestEntityTooLarge for a body over max_bytes and
+    stripe.SignatureVerificationError if the header is malformed, older
+    than tolerance seconds or does not match.
+    """
+    timestamp, signatures = _parse_header(header)
+    if tolerance and timestamp < time.time() - tolerance:
+        raise _verification_error("Timestamp outside the tolerance zone (%d)" % timestamp, header)
+
+    mac = hmac.new(secret.encode("utf-8"), b"%d." % timestamp, sha256)
+    if content_length is not None:
+        if content_length > max_bytes:
+            raise _too_large(max_bytes)
+        body = bytearray(content_length)
+        view = memoryview(body)
+        received = 0
+        while received < content_length:
+            chunk = stream.read(min(CHUNK_SIZE, content_length - received))
+            if not chunk:
+                del view
+                del body[received:]
+                break
+            view[received:received + len(chunk)] = chunk
+            mac.update(chunk)
+            received += len(chunk)
+    else:
+        # Chunked transfer encoding: no length to check up front
+        body = bytearray()
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if len(body) + len(chunk) > max_bytes:
+                raise _too_large(max_bytes)
+            body += chunk
+            mac.update(chunk)
+
+    # As bytes: compare_digest refuses str with non-ASCII characters
+    expected = mac.hexdigest().encode("ascii")
+    if not any(hmac.compare_digest(expected, signature.encode("utf-8", "replace")) for signature in signatures):
+        raise _verification_error("No signatures found matching the expected signature for payload", header)
+    return body